@@ -0,0 +1,89 @@
+import numpy
+
+
+"""Plays for the ActorLearner. Moves are picked by a brain that never learns anything itself.
+Instead, every time that brain would have learned, the moves it would have learned from are
+recorded, and they are handed over in batches to the one brain that does learn, in another process.
+The brain that plays is kept up to date by passing it the learning brain's policy now and then."""
+class ActorBrain:
+
+
+    def __init__(self, brain):
+        self.brain = brain
+        # A brain without one, such as OptimalPolicyBrain, never learns, so there is nothing to record.
+        self.advances_learning_interval = getattr(brain, 'advances_learning_interval', None)
+        self.policy = None
+        self.clear()
+
+
+    def clear(self):
+        self.roads = []
+        self.car_positions = []
+        self.actions = []
+        self.step_actions = []
+        self.step_crashed = []
+        self.step_num_advances = []
+
+
+    # The number of learning steps recorded since the last call to take_steps().
+    def __len__(self):
+        return len(self.step_actions)
+
+
+    # Plays by the given policy, from the learning brain's get_policy(), from now on.
+    def set_policy(self, policy):
+        self.policy = policy
+        self.brain.set_policy(policy)
+
+
+    # Catches up with the learning brain's get_policy_changes(), for brains that have them. The
+    # policy is changed in place, so it stays up to date for the next series as well.
+    def apply_policy_changes(self, changes):
+        self.brain.apply_policy_changes(changes)
+
+
+    def on_series(self, num_lanes):
+        self.brain.on_series(num_lanes)
+        # A new series may have started the brain over from scratch.
+        if (self.policy is not None):
+            self.brain.set_policy(self.policy)
+
+
+    def on_before_move(self, car_position, current_road_section, road):
+        return self.brain.on_before_move(car_position, current_road_section, road)
+
+
+    def on_after_move(self, action, crashed, num_advances, recent_road_states):
+        if (self.advances_learning_interval is None):
+            return
+        # The same rule the brains use to decide when to learn.
+        if (crashed or (num_advances % self.advances_learning_interval == self.advances_learning_interval-1)):
+            # These are views into the game's trajectory buffer, which is overwritten on the next
+            # move, so copy them.
+            (roads, car_positions, actions) = recent_road_states.window(self.advances_learning_interval)
+            self.roads.append(roads.copy())
+            self.car_positions.append(car_positions.copy())
+            self.actions.append(actions.copy())
+            self.step_actions.append(action)
+            self.step_crashed.append(crashed)
+            self.step_num_advances.append(num_advances)
+
+
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        self.brain.on_crashed(fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless)
+
+
+    def get_stats(self):
+        return self.brain.get_stats()
+
+
+    # Returns the learning steps recorded since the last call and starts over. The windows of all the
+    # steps are stacked one after the other into roads, car_positions and actions, and
+    # window_lengths says how many rows belong to each step.
+    def take_steps(self):
+        steps = (numpy.concatenate(self.roads), numpy.concatenate(self.car_positions), numpy.concatenate(self.actions),
+            numpy.array([len(actions) for actions in self.actions], dtype=numpy.int64),
+            numpy.array(self.step_actions, dtype=numpy.int64), numpy.array(self.step_crashed, dtype=bool),
+            numpy.array(self.step_num_advances, dtype=numpy.int64))
+        self.clear()
+        return steps
@@ -0,0 +1,196 @@
+import multiprocessing
+import pickle
+import queue
+import random
+import time
+import numpy
+from ActorBrain import ActorBrain
+from GameStructure import GameStructure
+
+
+"""Trains a brain with several games going at once. Each actor is a process of its own, playing
+headless games with a copy of the brain that only plays (see ActorBrain). The moves the brain
+learns from are sent back through a queue, a batch of whole games at a time, to this process -- the
+learner -- which feeds each batch to the one brain that learns in a single call to its learn_steps().
+Every policy_broadcast_interval learning steps, the learner sends the brain's latest policy (the
+network's weights) back out to the actors. Brains with get_policy_changes(), such as QValueBrain,
+only send what changed since the last time, rather than the whole q-table.
+
+All the actors play the same road width. The first one to complete the level completes it for all
+of them; the others finish the game they are playing and then everyone moves on to the next road
+width together.
+
+The brains need get_policy(), set_policy() and learn_steps(). brain_factory must be something a new process can
+unpickle, such as a function defined at the top level of a module, or a functools.partial of one.
+Each actor makes a brain of its own with it, so tensorflow brains start tensorflow in every actor,
+though they only ever play with the numpy copy of the network."""
+class ActorLearner:
+
+
+    def __init__(self, num_actors, starting_road_width, ending_road_width, num_advances_level_complete, \
+            random_obstacle_probability, max_number_display_road_states, max_number_road_states, \
+            advances_learning_interval, max_history, policy_broadcast_interval=1000, \
+            steps_per_message=256, headless=False, seed=None):
+        self.num_actors = num_actors
+        self.starting_road_width = starting_road_width
+        self.ending_road_width = ending_road_width
+        self.num_advances_level_complete = num_advances_level_complete
+        self.advances_learning_interval = advances_learning_interval
+        # Everything an actor needs to set up a GameStructure, after the road widths.
+        self.game_settings = (num_advances_level_complete, 0, random_obstacle_probability, \
+            max_number_display_road_states, max_number_road_states, advances_learning_interval, \
+            max_history)
+        self.policy_broadcast_interval = policy_broadcast_interval
+        # Actors send their learning steps once they have at least this many, at the end of a game.
+        self.steps_per_message = steps_per_message
+        self.headless = headless
+        self.seed = seed
+        self.num_games_played = 0
+        self.num_total_advances = 0
+        # One entry per road width played, the same as GameStructure's.
+        self.series_results = []
+
+
+    def start(self, brain_factory):
+        self.brain = brain_factory()
+        # Forking a process that has already started tensorflow is asking for trouble, so start the
+        # actors from scratch.
+        context = multiprocessing.get_context('spawn')
+        # If the learner falls behind, the actors wait for it rather than filling up the memory.
+        self.transition_queue = context.Queue(maxsize=4*self.num_actors)
+        self.stop_event = context.Event()
+        self.command_queues = [context.Queue() for actor_number in range(self.num_actors)]
+        self.actors = []
+        for actor_number in range(self.num_actors):
+            seed = None if (self.seed is None) else (self.seed + actor_number)
+            self.actors.append(context.Process(target=run_actor, args=(brain_factory, self.game_settings, \
+                self.command_queues[actor_number], self.transition_queue, self.stop_event, \
+                self.steps_per_message, seed), daemon=True))
+
+        for actor in self.actors:
+            actor.start()
+        try:
+            # Learn how to drive the three lane road. Then add a lane, and then another.
+            for road_width in range(self.starting_road_width, self.ending_road_width):
+                self.__play_series(road_width)
+            for command_queue in self.command_queues:
+                command_queue.put(None)
+            for actor in self.actors:
+                actor.join()
+        finally:
+            for actor in self.actors:
+                if (actor.is_alive()):
+                    actor.terminate()
+
+
+    def __play_series(self, road_width):
+        start_time = time.perf_counter()
+        start_num_games_played = self.num_games_played
+        start_num_total_advances = self.num_total_advances
+        self.brain.on_series(road_width - 2)
+        self.stop_event.clear()
+        policy = pickle.dumps(self.brain.get_policy())
+        for command_queue in self.command_queues:
+            command_queue.put(('series', road_width, policy))
+
+        num_playing = self.num_actors
+        num_steps_since_broadcast = 0
+        max_advances = 0
+        while (num_playing > 0):
+            message = self.__next_message()
+            if (message[0] == 'steps'):
+                num_steps_since_broadcast += self.__learn(message[1])
+                if (num_steps_since_broadcast >= self.policy_broadcast_interval):
+                    self.__broadcast_policy()
+                    num_steps_since_broadcast = 0
+            else:
+                (message_type, completed, num_games_played, num_total_advances, actor_max_advances) = message
+                num_playing -= 1
+                self.num_games_played += num_games_played
+                self.num_total_advances += num_total_advances
+                max_advances = max(max_advances, actor_max_advances)
+                if (completed):
+                    self.stop_event.set()
+
+        self.series_results.append({'road_width': road_width, \
+            'num_games': self.num_games_played - start_num_games_played, \
+            'num_advances': self.num_total_advances - start_num_total_advances, \
+            'seconds': time.perf_counter() - start_time})
+
+        if (not self.headless):
+            print('Road width: {0} complete. Games played: {1}, max advances: {2}.'.format(road_width, \
+                self.num_games_played, max_advances))
+
+
+    def __next_message(self):
+        while True:
+            try:
+                return self.transition_queue.get(timeout=1)
+            except queue.Empty:
+                if (not all(actor.is_alive() for actor in self.actors)):
+                    raise RuntimeError('An actor stopped unexpectedly.')
+
+
+    # Feeds a batch of learning steps from ActorBrain.take_steps() to the brain, all at once. Returns
+    # the number of steps.
+    def __learn(self, steps):
+        self.brain.learn_steps(*steps)
+        return len(steps[3])
+
+
+    def __broadcast_policy(self):
+        # Pickle the policy once, here and now. The queues pickle in a thread of their own, by which
+        # time the brain could be learning from the next batch.
+        if (hasattr(self.brain, 'get_policy_changes')):
+            message = ('policy_changes', pickle.dumps(self.brain.get_policy_changes()))
+        else:
+            message = ('policy', pickle.dumps(self.brain.get_policy()))
+        for command_queue in self.command_queues:
+            command_queue.put(message)
+
+
+# What every actor process runs. It plays one road width for each 'series' command, until the level
+# is complete or the learner says to stop, and then reports back. None ends the process.
+def run_actor(brain_factory, game_settings, command_queue, transition_queue, stop_event, steps_per_message, seed):
+    random.seed(seed)
+    numpy.random.seed(seed)
+    actor_brain = ActorBrain(brain_factory())
+
+    while True:
+        command = command_queue.get()
+        if (command is None):
+            return
+        if (command[0] != 'series'):
+            continue # A policy that arrived after the last series was over.
+        (command_type, road_width, policy) = command
+        actor_brain.set_policy(pickle.loads(policy))
+
+        # The games only ever end with a crash, so sending whole games keeps each batch of learning
+        # steps in one piece.
+        def on_game_over(road_width, game_number, num_advances, max_advances):
+            if (len(actor_brain) >= steps_per_message):
+                transition_queue.put(('steps', actor_brain.take_steps()))
+            latest_policy = None
+            while True:
+                try:
+                    (command_type, policy) = command_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if (command_type == 'policy'):
+                    latest_policy = policy
+                else:
+                    # Each set of changes builds on the ones before, so none of them can be skipped.
+                    actor_brain.apply_policy_changes(pickle.loads(policy))
+            if (latest_policy is not None):
+                actor_brain.set_policy(pickle.loads(latest_policy))
+            if (stop_event.is_set()):
+                game.stop()
+
+        game = GameStructure(road_width, road_width + 1, *game_settings, True, headless=True, \
+            progress_callback=on_game_over)
+        game.start(actor_brain)
+        if (len(actor_brain) > 0):
+            transition_queue.put(('steps', actor_brain.take_steps()))
+        completed = (game.num_advances >= game.num_advances_level_complete)
+        transition_queue.put(('series_done', completed, game.num_games_played, game.num_total_advances, \
+            game.num_advances_for_road_width))
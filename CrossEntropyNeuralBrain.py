@@ -1,13 +1,17 @@
 import random
 import time
-import tensorflow
+import numpy
+from StateEncoder import StateEncoder
+from NumpyPolicy import NumpyPolicy
+from TensorflowLoader import import_tensorflow
 
 
 class CrossEntropyNeuralBrain:
 
 
     def __init__(self, safe_reward, crash_reward, advances_learning_interval, base_discount, \
-        num_actions, step_size, random_move_probability, num_road_sections_in_q_values):
+        num_actions, step_size, random_move_probability, num_road_sections_in_q_values, max_lanes=None, \
+        observation_radius=None):
         self.MOVE_LEFT_ACTION = -1
         self.STAY_STILL_ACTION = 0
         self.MOVE_RIGHT_ACTION = 1
@@ -20,7 +24,18 @@ class CrossEntropyNeuralBrain:
         self.step_size = step_size
         self.random_move_probability = random_move_probability
         self.num_road_sections_in_q_values = num_road_sections_in_q_values
+        # Optional. If given, states are laid out for a road of max_lanes lanes whatever the
+        # actual road width, and what the brain learns carries over from one width to the next.
+        self.max_lanes = max_lanes
+        # Optional. If given, the brain only sees the observation_radius lanes on either side of the
+        # car, so the states are the same small size however wide the road is. Overrides max_lanes.
+        self.observation_radius = observation_radius
         self.tensorflow_session = None
+        # Picking moves happens in numpy, with a copy of the weights refreshed after training.
+        self.numpy_policy = NumpyPolicy()
+
+        self.num_learning_steps = 0
+        self.loss = None
 
         self.DEBUG_MESSAGES = False
 
@@ -28,16 +43,21 @@ class CrossEntropyNeuralBrain:
     def on_series(self, num_lanes):
         self.num_lanes = num_lanes
         self.car_road_state = None
-        # We completely retrain the neural network every time the size of the road changes. The
-        # tensors making up the neural network rely on the size of the road.
-        if (self.tensorflow_session != None):
-            self.tensorflow_session.close()
-        self.__initialize_tensorflow(1)
+        self.state_encoder = StateEncoder(self.num_lanes, self.num_road_sections_in_q_values, \
+            self.max_lanes, self.observation_radius)
+        # Without max_lanes or an observation_radius, the size of the state depends on the size of
+        # the road, so we completely retrain the neural network every time the size of the road
+        # changes. Otherwise the state is the same size for every road, so hang on to the neural
+        # network, and whatever it has learned so far, and simply carry on training it on the wider
+        # road.
+        if ((not self.state_encoder.width_independent) or (self.tensorflow_session is None)):
+            if (self.tensorflow_session != None):
+                self.tensorflow_session.close()
+            self.__initialize_tensorflow(1)
 
 
     def on_before_move(self, car_position, current_road_section, road):
-        self.car_road_state = []
-        self.car_road_state.append(self.__state_to_qvalues_list(car_position, road))
+        self.car_road_state = self.state_encoder.encode(car_position, road)
 
         action = 0 # The default action is to stay still.
         # With some presumably small chance, move randomly. This is likely not necessary with this
@@ -63,11 +83,12 @@ class CrossEntropyNeuralBrain:
             # In the much more likely case that the agent is using its past learning to determine
             # the next move, determine the q-value to decide how to move. Essentially, take a
             # snapshot of the state -- where the car is and where the boulders are, and retrieve
-            # the preferred action.
-            predicted_action = self.tensorflow_session.run(self.sample_actions_tensor, feed_dict={self.car_road_tensor: self.car_road_state})
+            # the preferred action. The numpy copy of the neural network does the same sampling
+            # as sample_actions_tensor without the cost of a tensorflow session call.
+            predicted_action = self.numpy_policy.sample_action(self.car_road_state)
             # We subtract 1 because the action is stored as an unsigned int in tensorflow (0-2),
             # however we prefer to work in terms of -1, 0 and 1.
-            action = predicted_action[0][0] - 1
+            action = predicted_action - 1
 
         return action
 
@@ -84,16 +105,77 @@ class CrossEntropyNeuralBrain:
                 print('action: {0}, crashed: {1}, na: {2}, reward: {3}, recent_road_states: {4}'.format(action, crashed, num_advances, reward, recent_road_states))
 
             # The main purpose of this method: Learn.
+            self.num_learning_steps += 1
             self.__update_qvalues(reward, recent_road_states)
     
 
-    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances):
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        # In headless mode the game keeps track of progress itself. Never print or sleep.
+        if (headless):
+            return
         if ((not fast_mode) or (game_number % display_frequency == 0)):
             print("Crashed! Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.".format(road_width, game_number, num_advances, max_advances))
             time.sleep(1)
 
 
+    # What the brain plays by -- a copy of its network's weights -- so that it can be handed over to
+    # a copy of the brain that only plays. The brain keeps learning, but the copy stays put.
+    def get_policy(self):
+        return tuple(weight.copy() for weight in self.numpy_policy.get_weights())
+
+
+    # The road widths the policy from get_policy() can be played on, or None for any of them. Without
+    # max_lanes or an observation_radius, the policy only fits the road width it was learned on.
+    def get_policy_road_widths(self):
+        return None if (self.state_encoder.width_independent) else [self.num_lanes + 2]
+
+
+    # Plays by the given policy from get_policy() from now on.
+    def set_policy(self, policy):
+        self.numpy_policy.set_weights(*policy)
+
+
+    # How the learning is going, for telemetry. The loss is from the latest training step, or None
+    # before the first.
+    def get_stats(self):
+        loss = None if (self.loss is None) else float(self.loss)
+        return {'learning_steps': self.num_learning_steps, 'loss': loss}
+
+
+    # Trains on a minibatch of moves from somewhere other than the game being played, such as a
+    # recording. The states are encoded by state_encoder and the actions are 0-2. Only the states,
+    # actions and rewards count towards the cross entropy; next_states and dones are accepted so
+    # that every neural brain can be trained the same way. Every move counts as a learning step.
+    def train_batch(self, states, actions, rewards, next_states=None, dones=None):
+        self.num_learning_steps += len(states)
+        self.__train(states, actions, rewards)
+
+
+    # Learns from a batch of learning steps, such as ActorBrain.take_steps() hands out. The windows of
+    # all the steps are stacked one after the other into roads, car_positions and actions, and
+    # window_lengths says how many rows belong to each step. They are all trained on in one go, each
+    # state weighted by its own step's reward.
+    def learn_steps(self, roads, car_positions, actions, window_lengths, step_actions, step_crashed, step_num_advances):
+        self.num_learning_steps += len(window_lengths)
+        rewards = numpy.where(step_crashed, self.crash_reward, self.safe_reward).astype(numpy.float32)
+        # We add 1 because tensorflow wants the action as an unsigned int (0-2).
+        self.__train(self.state_encoder.encode_batch(car_positions, roads), actions + 1, \
+            numpy.repeat(rewards, window_lengths))
+
+
+    # One step of training on the cross entropy of the given states, actions and rewards.
+    def __train(self, states, actions, rewards):
+        (train, self.loss) = self.tensorflow_session.run([self.train_tensor, self.loss_tensor],
+                                                        feed_dict={self.car_road_tensor: states,
+                                                                    self.actions_inputs_tensor: actions,
+                                                                    self.rewards_tensor: rewards})
+        self.__refresh_numpy_policy()
+
+
     def __initialize_tensorflow(self, hidden_layers):
+        # Only loaded once this brain is actually used.
+        tensorflow = import_tensorflow()
+
         # What information needs to be stored for the state? The car position, the road and any
         # obstacles.
         #
@@ -119,7 +201,7 @@ class CrossEntropyNeuralBrain:
         #
         # state:  |0|0|1  |0|0|0 |0|0|0 |0|0|1
         # action: |1|0|0
-        number_states = self.num_lanes + (self.num_lanes * self.num_road_sections_in_q_values)
+        number_states = self.state_encoder.state_size
         number_actions = self.num_actions
 
         # Automatically reset tensorflow variables. Needed since we are resetting the tensorflow session for every road width.
@@ -147,69 +229,45 @@ class CrossEntropyNeuralBrain:
         # training of the neural network
         self.sample_actions_tensor = tensorflow.multinomial(logits = car_road_logits_tensor, num_samples = 1, name="sample_actions_tensor")
 
-        # Use cross-entropy for loss.
-        cross_entropies_tensor = tensorflow.losses.softmax_cross_entropy(onehot_labels=tensorflow.one_hot(self.actions_inputs_tensor, number_actions), logits=car_road_logits_tensor)
-        loss_tensor = tensorflow.reduce_sum(self.rewards_tensor * cross_entropies_tensor, name="loss_tensor")
+        # Use cross-entropy for loss, one per sample, so that each is weighted by its own reward.
+        # (The default reduction would average them into a single number first.)
+        cross_entropies_tensor = tensorflow.losses.softmax_cross_entropy(onehot_labels=tensorflow.one_hot(self.actions_inputs_tensor, number_actions), logits=car_road_logits_tensor,
+            reduction=tensorflow.losses.Reduction.NONE)
+        self.loss_tensor = tensorflow.reduce_sum(self.rewards_tensor * cross_entropies_tensor, name="loss_tensor")
 
         # Taking a walk downhill.
         optimizer_tensor = tensorflow.train.RMSPropOptimizer(learning_rate=0.001, decay=0.99, name="optimizer_tensor")
-        self.train_tensor = optimizer_tensor.minimize(loss_tensor, name="train_tensor")
+        self.train_tensor = optimizer_tensor.minimize(self.loss_tensor, name="train_tensor")
 
         initializer = tensorflow.global_variables_initializer()
         self.tensorflow_session = tensorflow.Session()
         self.tensorflow_session.run(initializer)
 
+        # The hidden layer's kernel and bias, then the logits layer's, in the order they were made.
+        self.weight_tensors = tensorflow.trainable_variables()
+        self.__refresh_numpy_policy()
 
-    def __update_qvalues(self, reward, recent_road_states):
-        # We don't necessarily learn from all the states. Grab the latest x states.
-        learning_states = recent_road_states[-self.advances_learning_interval:]
-
-        for current_state in learning_states:
-            # Grab the relevant pieces from the state.
-            road_sections = current_state[0]
-            car_position = current_state[1]
-            # We add 1 because we want to store the action as an unsigned int in tensorflow (0-2)
-            # in the following step, however the code up to this point worked in terms of -1, 0 and
-            # 1.
-            action = current_state[2] + 1
-
-            road_sections_and_car_position = [self.__state_to_qvalues_list(car_position, road_sections)]
 
-            self.tensorflow_session.run(self.train_tensor, feed_dict={self.car_road_tensor: road_sections_and_car_position,
-                                                                        self.actions_inputs_tensor: [action],
-                                                                        self.rewards_tensor: [reward]})
+    # Copies the neural network's current weights over to the numpy policy.
+    def __refresh_numpy_policy(self):
+        self.numpy_policy.set_weights(*self.tensorflow_session.run(self.weight_tensors))
 
 
-    def __state_to_qvalues_list(self, car_position, road_sections):
-        # What information needs to be stored? The car position, the road and any obstacles.
-        #
-        # This information is stored in a binary manner, for reasons that will become clear later.
-        # Here's how the structure looks:
-        # |n|n|n  |n|n|n |n|n|n |n|n|n
-        #  car          roadway
-        #
-        # If the car is on the left side of the road, the left-most number will be 1. In the
-        # middle, the second number will be 1 and on the right side of the road, the third will be
-        # set. The numbers for the roadway will be all 0s for a roadway with no obstacles. If there
-        # is 1 obstacle, then a 1 will be set describing its position.
-        #
-        # For example, a car on the right of the road that comes across a boulder similarly on the
-        # road but two spots away will have a state like this:
-        #
-        # |0|0|1  |0|0|0 |0|0|0 |0|0|1
-        #
-        # Create the list with the appropriate number of values and fill it will all 0s.
-        qvalues_list = [0] * (self.num_lanes + (self.num_lanes * self.num_road_sections_in_q_values))
-
-        # Put a 1 in the place representing the car's position.
-        qvalues_list[car_position-1] = 1
-
-        # Look for obstacles and put a 1 in the appropriate spots if we find them.
-        for road_section_index, road_section in enumerate(road_sections):
-            for road_obstacle_it in range(1,len(road_section)-1):
-                if (road_section[road_obstacle_it] != ' '):
-                    qvalues_list[self.num_lanes+(self.num_lanes*road_section_index)+road_obstacle_it-1] = 1
-                else:
-                    qvalues_list[self.num_lanes+(self.num_lanes*road_section_index)+road_obstacle_it-1] = 0
-
-        return qvalues_list
+    def __update_qvalues(self, reward, recent_road_states):
+        # We don't necessarily learn from all the states. Grab the latest x states. The game hands
+        # us views into its trajectory buffer.
+        (learning_roads, learning_car_positions, learning_actions) = recent_road_states.window(self.advances_learning_interval)
+
+        # One row per state, each holding the car position and the road ahead.
+        road_sections_and_car_positions = self.state_encoder.encode_batch(learning_car_positions, learning_roads)
+
+        # We add 1 because we want to store the action as an unsigned int in tensorflow (0-2) in
+        # the following step, however the code up to this point worked in terms of -1, 0 and 1.
+        actions = learning_actions + 1
+
+        # Train on all the states at once.
+        (train, self.loss) = self.tensorflow_session.run([self.train_tensor, self.loss_tensor],
+                                                        feed_dict={self.car_road_tensor: road_sections_and_car_positions,
+                                                                    self.actions_inputs_tensor: actions,
+                                                                    self.rewards_tensor: numpy.full(len(actions), reward, dtype=numpy.float32)})
+        self.__refresh_numpy_policy()
@@ -1,13 +1,17 @@
 import time
 import random
-import tensorflow
+import numpy
+from StateEncoder import StateEncoder
+from NumpyPolicy import NumpyPolicy
+from TensorflowLoader import import_tensorflow
 
 
 class CrossEntropyQBrain:
 
 
     def __init__(self, safe_reward, crash_reward, advances_learning_interval, base_discount, \
-        num_actions, step_size, random_move_probability, num_road_sections_in_q_values):
+        num_actions, step_size, random_move_probability, num_road_sections_in_q_values, max_lanes=None, \
+        observation_radius=None):
         self.MOVE_LEFT_ACTION = -1
         self.STAY_STILL_ACTION = 0
         self.MOVE_RIGHT_ACTION = 1
@@ -20,7 +24,18 @@ class CrossEntropyQBrain:
         self.step_size = step_size
         self.random_move_probability = random_move_probability
         self.num_road_sections_in_q_values = num_road_sections_in_q_values
+        # Optional. If given, states are laid out for a road of max_lanes lanes whatever the
+        # actual road width, and what the brain learns carries over from one width to the next.
+        self.max_lanes = max_lanes
+        # Optional. If given, the brain only sees the observation_radius lanes on either side of the
+        # car, so the states are the same small size however wide the road is. Overrides max_lanes.
+        self.observation_radius = observation_radius
         self.tensorflow_session = None
+        # Picking moves happens in numpy, with a copy of the weights refreshed after training.
+        self.numpy_policy = NumpyPolicy()
+
+        self.num_learning_steps = 0
+        self.loss = None
 
         self.DEBUG_MESSAGES = False
 
@@ -28,18 +43,19 @@ class CrossEntropyQBrain:
     def on_series(self, num_lanes):
         self.num_lanes = num_lanes
         self.car_road_state = None
-        if (self.tensorflow_session != None):
-            self.tensorflow_session.close()
-        self.__initialize_tensorflow()
+        self.state_encoder = StateEncoder(self.num_lanes, self.num_road_sections_in_q_values, \
+            self.max_lanes, self.observation_radius)
+        if ((not self.state_encoder.width_independent) or (self.tensorflow_session is None)):
+            if (self.tensorflow_session != None):
+                self.tensorflow_session.close()
+            self.__initialize_tensorflow()
         
 
     def on_before_move(self, car_position, current_road_section, road):
-        self.car_road_state = []
-        self.car_road_state.append(self.__state_to_qvalues_list(car_position, road))
+        self.car_road_state = self.state_encoder.encode(car_position, road)
         action = 0 # The default action is to stay still.
-        predicted_action = self.tensorflow_session.run(self.sample_actions_tensor
-            , feed_dict={self.car_road_tensor: self.car_road_state})
-        action = predicted_action[0][0]-1
+        predicted_action = self.numpy_policy.sample_action(self.car_road_state)
+        action = predicted_action-1
         return action
 
 
@@ -49,17 +65,62 @@ class CrossEntropyQBrain:
             if (crashed):
                 reward = self.crash_reward
 
+            self.num_learning_steps += 1
             self.__update_qvalues(action, reward, recent_road_states)
 
 
-    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances):
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        # In headless mode the game keeps track of progress itself. Never print or sleep.
+        if (headless):
+            return
         if ((not fast_mode) or (game_number % display_frequency == 0)):
             print("Crashed! Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.".format(road_width, game_number, num_advances, max_advances))
             time.sleep(1)
-    
+
+
+    # What the brain plays by -- a copy of its network's weights -- so that it can be handed over to
+    # a copy of the brain that only plays. The brain keeps learning, but the copy stays put.
+    def get_policy(self):
+        return tuple(weight.copy() for weight in self.numpy_policy.get_weights())
+
+
+    # The road widths the policy from get_policy() can be played on, or None for any of them. Without
+    # max_lanes or an observation_radius, the policy only fits the road width it was learned on.
+    def get_policy_road_widths(self):
+        return None if (self.state_encoder.width_independent) else [self.num_lanes + 2]
+
+
+    # Plays by the given policy from get_policy() from now on.
+    def set_policy(self, policy):
+        self.numpy_policy.set_weights(*policy)
+
+
+    # How the learning is going, for telemetry. The loss is from the latest training step, or None
+    # before the first.
+    def get_stats(self):
+        loss = None if (self.loss is None) else float(self.loss)
+        return {'learning_steps': self.num_learning_steps, 'loss': loss}
+
+
+    # Learns from a batch of learning steps, such as ActorBrain.take_steps() hands out. The windows of
+    # all the steps are stacked one after the other into roads, car_positions and actions, and
+    # window_lengths says how many rows belong to each step. They are all trained on in one go, each
+    # state weighted by its own step's reward.
+    def learn_steps(self, roads, car_positions, actions, window_lengths, step_actions, step_crashed, step_num_advances):
+        self.num_learning_steps += len(window_lengths)
+        rewards = numpy.where(step_crashed, self.crash_reward, self.safe_reward).astype(numpy.float32)
+        (train, self.loss) = self.tensorflow_session.run([self.train_tensor, self.loss_tensor], feed_dict
+                                                        ={self.car_road_tensor: self.state_encoder.encode_batch(car_positions, roads),
+                                                        self.chosen_action_tensor: actions + 1,
+                                                        self.rewards_tensor: numpy.repeat(rewards, window_lengths)})
+        self.__refresh_numpy_policy()
+
 
     def __initialize_tensorflow(self):
-        number_states = self.num_lanes + (self.num_lanes * self.num_road_sections_in_q_values)
+        # Only loaded once this brain is actually used.
+        tensorflow = import_tensorflow()
+
+        number_states = self.state_encoder.state_size
         number_action = self.num_actions
 
         # Ask for prediction.
@@ -75,32 +136,40 @@ class CrossEntropyQBrain:
         # Train.
         self.chosen_action_tensor = tensorflow.placeholder(shape=[None], dtype=tensorflow.uint8)
         self.rewards_tensor = tensorflow.placeholder(shape=[None], dtype=tensorflow.float32)
+        # One cross-entropy per sample, so that each is weighted by its own reward.
         cross_entropies_tensor = tensorflow.losses.softmax_cross_entropy(
             onehot_labels=tensorflow.one_hot(self.chosen_action_tensor, number_action)
-            , logits=prediction_tensor)
-        loss_tensor = tensorflow.reduce_sum(self.rewards_tensor * cross_entropies_tensor)
+            , logits=prediction_tensor, reduction=tensorflow.losses.Reduction.NONE)
+        self.loss_tensor = tensorflow.reduce_sum(self.rewards_tensor * cross_entropies_tensor)
 
         optimizer_tensor = tensorflow.train.RMSPropOptimizer(learning_rate=0.001, decay=0.99)
-        self.train_tensor = optimizer_tensor.minimize(loss_tensor)
+        self.train_tensor = optimizer_tensor.minimize(self.loss_tensor)
 
         initializer = tensorflow.global_variables_initializer()
         self.tensorflow_session = tensorflow.Session()
         self.tensorflow_session.run(initializer)
+
+        # The hidden layer's kernel and bias, then the logits layer's, in the order they were made.
+        self.weight_tensors = tensorflow.trainable_variables()
+        self.__refresh_numpy_policy()
+
+
+    # Copies the neural network's current weights over to the numpy policy.
+    def __refresh_numpy_policy(self):
+        self.numpy_policy.set_weights(*self.tensorflow_session.run(self.weight_tensors))
     
 
     def __update_qvalues(self, action, reward, recent_road_states):
-        learning_states = recent_road_states[-self.advances_learning_interval:]
+        (learning_roads, learning_car_positions, learning_actions) = recent_road_states.window(self.advances_learning_interval)
 
-        for current_state in learning_states:
-            road_sections = current_state[0]
-            car_position = current_state[1]
-            action = current_state[2]+1
+        road_sections_and_car_positions = self.state_encoder.encode_batch(learning_car_positions, learning_roads)
+        actions = learning_actions + 1
 
-            road_sections_and_car_position = [self.__state_to_qvalues_list(car_position, road_sections)]
-            self.tensorflow_session.run(self.train_tensor, feed_dict
-                                                            ={self.car_road_tensor: road_sections_and_car_position,
-                                                            self.chosen_action_tensor: [action],
-                                                            self.rewards_tensor: [reward]})
+        (train, self.loss) = self.tensorflow_session.run([self.train_tensor, self.loss_tensor], feed_dict
+                                                        ={self.car_road_tensor: road_sections_and_car_positions,
+                                                        self.chosen_action_tensor: actions,
+                                                        self.rewards_tensor: numpy.full(len(actions), reward, dtype=numpy.float32)})
+        self.__refresh_numpy_policy()
 
 
     # def __bellmans_equation(self, last_q_value, reward, discount, max_q_value):
@@ -115,21 +184,3 @@ class CrossEntropyQBrain:
     #         qvalue = self.__bellmans_equation(self.latest_qvalues[qvalues_tuple],
     #             0, self.base_discount, self.max_qvalues[qvalues_tuple])
     #     return qvalue
-
-
-    def __state_to_qvalues_list(self, car_position, road_sections):
-        qvalues_list = [0] * (self.num_lanes + (self.num_lanes
-            * self.num_road_sections_in_q_values))
-
-        qvalues_list[car_position-1] = 1
-
-        for road_section_index, road_section in enumerate(road_sections):
-            for road_obstacle_it in range(1,len(road_section)-1):
-                if (road_section[road_obstacle_it] != ' '):
-                    qvalues_list[self.num_lanes+(self.num_lanes
-                        *road_section_index)+road_obstacle_it-1] = 1
-                else:
-                    qvalues_list[self.num_lanes+(self.num_lanes
-                        *road_section_index)+road_obstacle_it-1] = 0
-
-        return qvalues_list
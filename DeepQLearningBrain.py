@@ -0,0 +1,369 @@
+import abc
+import random
+import time
+import numpy
+from StateEncoder import StateEncoder
+from NumpyPolicy import NumpyPolicy
+
+
+"""Deep Q learning, short of the neural network itself: picking moves, collecting the samples to
+train on, experience replay and the training schedule. DeepQNeuralBrain (tensorflow) and
+NumpyDeepQBrain (plain numpy) each bring the neural network, by filling in initialize_network(),
+predict_q_values(), train_step() and, if they need it, after_training()."""
+class DeepQLearningBrain(abc.ABC):
+
+
+    def __init__(self, safe_reward, crash_reward, advances_learning_interval, base_discount, \
+        gamma, num_actions, step_size, deep_q_learning_interval, random_move_probability,
+        num_road_sections_in_q_values, experience_replay=None, replay_batch_size=64, replay_batches=16,
+        training_batch_size=100, training_epochs=1, max_lanes=None, observation_radius=None):
+        self.MOVE_LEFT_ACTION = -1
+        self.STAY_STILL_ACTION = 0
+        self.MOVE_RIGHT_ACTION = 1
+
+        self.safe_reward = safe_reward
+        self.crash_reward = crash_reward
+        self.advances_learning_interval = advances_learning_interval
+        self.base_discount = base_discount
+        self.gamma = gamma
+        self.num_actions = num_actions
+        self.step_size = step_size
+        self.deep_q_learning_interval = deep_q_learning_interval
+        self.random_move_probability = random_move_probability
+        self.num_road_sections_in_q_values = num_road_sections_in_q_values
+        # Optional. If given, states are laid out for a road of max_lanes lanes whatever the
+        # actual road width, and what the brain learns carries over from one width to the next.
+        self.max_lanes = max_lanes
+        # Optional. If given, the brain only sees the observation_radius lanes on either side of the
+        # car, so the states are the same small size however wide the road is. Overrides max_lanes.
+        self.observation_radius = observation_radius
+        # Optional. If given (an ExperienceReplay or a PrioritizedExperienceReplay), every
+        # transition is also remembered there, and each time the neural network is trained we
+        # replay replay_batches minibatches of replay_batch_size transitions from it.
+        self.experience_replay = experience_replay
+        self.replay_batch_size = replay_batch_size
+        self.replay_batches = replay_batches
+        # Every deep_q_learning_interval samples, the neural network is trained on them in
+        # minibatches of training_batch_size, training_epochs times over.
+        self.training_batch_size = training_batch_size
+        self.training_epochs = training_epochs
+        # Moves are picked in numpy. Subclasses either train these weights in place or refresh
+        # them from their own copy after training.
+        self.numpy_policy = NumpyPolicy()
+        self.network_initialized = False
+
+        self.num_learning_steps = 0
+        self.loss = None
+
+        self.DEBUG_MESSAGES = False
+
+
+    def on_series(self, num_lanes):
+        self.num_lanes = num_lanes
+        self.car_road_state = None
+        self.state_encoder = StateEncoder(self.num_lanes, self.num_road_sections_in_q_values, \
+            self.max_lanes, self.observation_radius)
+        # The last state we learned from, waiting to find out what its next state is, and the
+        # advance it was made on.
+        self.pending_transition = None
+        self.num_advances_pushed = 0
+        # Without max_lanes or an observation_radius, the size of the state depends on the size of
+        # the road, so we completely retrain the neural network every time the size of the road
+        # changes. Otherwise the state is the same size for every road, so hang on to the neural
+        # network, and whatever it has learned so far, and simply carry on training it on the wider
+        # road. The samples still waiting to train on are the same size too, so they carry over
+        # as well.
+        if ((not self.state_encoder.width_independent) or (not self.network_initialized)):
+            if (self.experience_replay is not None):
+                self.experience_replay.clear()
+            self.initialize_network()
+            self.network_initialized = True
+            self.__initialize_training_inputs()
+
+
+    # With deep Q learning, we don't immediately update the neural network. The samples wait here
+    # until there are enough of them. A learning step can add up to advances_learning_interval
+    # samples, so leave room for that on top of the training interval.
+    def __initialize_training_inputs(self):
+        number_states = self.state_encoder.state_size
+        max_training_inputs = self.deep_q_learning_interval + self.advances_learning_interval
+        self.training_car_roads = numpy.zeros((max_training_inputs, number_states), dtype=numpy.float32)
+        self.training_actions = numpy.zeros(max_training_inputs, dtype=numpy.uint8)
+        self.training_rewards = numpy.zeros(max_training_inputs, dtype=numpy.float32)
+        self.training_q_values = numpy.zeros((max_training_inputs, self.num_actions), dtype=numpy.float32)
+        self.num_training_inputs = 0
+
+
+    def on_before_move(self, car_position, current_road_section, road):
+        self.car_road_state = self.state_encoder.encode(car_position, road)
+
+        action = 0 # The default action is to stay still.
+        # With some presumably small chance, move randomly. This is likely not necessary with this
+        # application, but is a good idea with many. The idea is that the game may not try some
+        # avenues with an improbable, but highly valuable reward. If there's some randomness baked
+        # in, then the game will try it eventually.
+        #
+        # The example I recall is that there is a door that 9 times out of 10 gives no reward, but
+        # 1 out of 10 gives a reward of 100. There is another door that always gives a reward of 1.
+        # The agent will quickly learn to always open the door of reward 1. However, it would be
+        # better off to play the odds and get a reward of 100 10% of the time. I think I saw this
+        # in Serena Yeung's excellent Stanford video called Reinforcement Learning (Lecture 14)?
+        if (random.random() < self.random_move_probability):
+            # Move left a third of the time, move right a third of the time and stay still a third
+            # of the time.
+            move_probability = random.random()
+            if (move_probability < 1/3):
+                action = self.MOVE_LEFT_ACTION
+            elif (move_probability > 2/3):
+                action = self.MOVE_RIGHT_ACTION
+            #else don't move.
+        else:
+            # In the much more likely case that the agent is using its past learning to determine
+            # the next move, determine the q-value to decide how to move. Essentially, take a
+            # snapshot of the state -- where the car is and where the boulders are, and retrieve
+            # the preferred action.
+            predicted_action = self.numpy_policy.sample_action(self.car_road_state)
+            # We subtract 1 because the neural network works with actions 0-2, however we prefer
+            # to work in terms of -1, 0 and 1.
+            action = predicted_action - 1
+
+        return action
+
+
+    def on_after_move(self, action, crashed, num_advances, recent_road_states):
+        # The game only learns if the car crashes (learns from its mistakes) or after a number of
+        # successful runs (learns from its successes).
+        if (crashed or (num_advances % self.advances_learning_interval == self.advances_learning_interval-1)):
+            reward = self.safe_reward
+            if (crashed):
+                reward = self.crash_reward
+
+            if (self.DEBUG_MESSAGES):
+                print('action: {0}, crashed: {1}, na: {2}, reward: {3}, recent_road_states: {4}'.format(action, crashed, num_advances, reward, recent_road_states))
+
+            # The main purpose of this method: Learn. We don't necessarily learn from all the
+            # states. Grab the latest x states. The game hands us views into its trajectory buffer.
+            (learning_roads, learning_car_positions, learning_actions) = recent_road_states.window(self.advances_learning_interval)
+            self.learn_steps(learning_roads, learning_car_positions, learning_actions, [len(learning_actions)], \
+                [action], [crashed], [num_advances])
+
+
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        # In headless mode the game keeps track of progress itself. Never print or sleep.
+        if (headless):
+            return
+        if ((not fast_mode) or (game_number % display_frequency == 0)):
+            print("Crashed! Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.".format(road_width, game_number, num_advances, max_advances))
+            time.sleep(1)
+
+
+    # What the brain plays by -- a copy of its network's weights -- so that it can be handed over to
+    # a copy of the brain that only plays. The brain keeps learning, but the copy stays put.
+    def get_policy(self):
+        return tuple(weight.copy() for weight in self.numpy_policy.get_weights())
+
+
+    # The road widths the policy from get_policy() can be played on, or None for any of them. Without
+    # max_lanes or an observation_radius, the policy only fits the road width it was learned on.
+    def get_policy_road_widths(self):
+        return None if (self.state_encoder.width_independent) else [self.num_lanes + 2]
+
+
+    # Plays by the given policy from get_policy() from now on.
+    def set_policy(self, policy):
+        self.numpy_policy.set_weights(*policy)
+
+
+    # How the learning is going, for telemetry. The loss is from the latest training step, or None
+    # before the first.
+    def get_stats(self):
+        loss = None if (self.loss is None) else float(self.loss)
+        return {'learning_steps': self.num_learning_steps, 'loss': loss}
+
+
+    # Trains on a minibatch of transitions from somewhere other than the game being played, such as
+    # a recording, with the same Q-learning target as experience replay. The states are encoded by
+    # state_encoder, the actions are 0-2 and dones says which transitions ended in a crash. Every
+    # transition counts as a learning step.
+    def train_batch(self, states, actions, rewards, next_states, dones):
+        self.num_learning_steps += len(states)
+        self.__train_on_transitions(states, actions, rewards, next_states, dones)
+        self.after_training()
+
+
+    # The neural network itself is up to the subclasses. Makes a fresh one for
+    # state_encoder.state_size inputs and num_actions outputs.
+    @abc.abstractmethod
+    def initialize_network(self):
+        pass
+
+
+    # The q values of each of the states, one row of num_actions per state.
+    @abc.abstractmethod
+    def predict_q_values(self, states):
+        pass
+
+
+    # One step of training on the loss mean(weight * (target q - q)^2), where the target for the
+    # chosen action is reward + gamma * q_prime[action] and the other actions' targets are just
+    # q_prime. Leaves the loss in self.loss.
+    @abc.abstractmethod
+    def train_step(self, car_roads, actions, rewards, q_prime, importance_weights=None):
+        pass
+
+
+    # Called once training is done for now, for subclasses that need to bring numpy_policy up to date.
+    def after_training(self):
+        pass
+
+
+    # Learns from a batch of learning steps, such as ActorBrain.take_steps() hands out, exactly as if
+    # on_after_move() had learned from them one at a time. The windows of all the steps are stacked
+    # one after the other into roads, car_positions and actions, and window_lengths says how many
+    # rows belong to each step. Rather than a step at a time, the samples go into the neural network
+    # a chunk at a time, each chunk running up to the step that sets off the next training.
+    def learn_steps(self, roads, car_positions, actions, window_lengths, step_actions, step_crashed, step_num_advances):
+        window_ends = numpy.cumsum(window_lengths)
+        step_crashed = numpy.asarray(step_crashed, dtype=bool)
+        num_steps = len(window_ends)
+        self.num_learning_steps += num_steps
+
+        first_step = 0
+        while (first_step < num_steps):
+            start = 0 if (first_step == 0) else window_ends[first_step - 1]
+            last_step = min(int(numpy.searchsorted(window_ends, \
+                start + self.deep_q_learning_interval - self.num_training_inputs)), num_steps - 1)
+            end = window_ends[last_step]
+
+            # One row per state, each holding the car position and the road ahead. They are
+            # encoded straight into the samples waiting to be pushed into the neural network.
+            training_start = self.num_training_inputs
+            training_end = training_start + end - start
+            road_sections_and_car_positions = self.state_encoder.encode_batch(car_positions[start:end], roads[start:end],
+                self.training_car_roads[training_start:training_end])
+
+            # We add 1 because the neural network works with actions 0-2, however the code up to
+            # this point worked in terms of -1, 0 and 1.
+            chunk_actions = actions[start:end] + 1
+
+            # Ask the neural network for the q values of all the states at once.
+            q_values = self.predict_q_values(road_sections_and_car_positions)
+
+            # Add the rest of the samples' values. Every state in a step's window gets that step's
+            # reward.
+            rewards = numpy.where(step_crashed[first_step:last_step+1], self.crash_reward, self.safe_reward)
+            self.training_actions[training_start:training_end] = chunk_actions
+            self.training_rewards[training_start:training_end] = numpy.repeat(rewards, window_lengths[first_step:last_step+1])
+            self.training_q_values[training_start:training_end] = q_values
+            self.num_training_inputs = training_end
+
+            if (self.experience_replay is not None):
+                window_start = 0
+                for step in range(first_step, last_step + 1):
+                    window_end = window_ends[step] - start
+                    self.__push_into_experience_replay(road_sections_and_car_positions[window_start:window_end], \
+                        chunk_actions[window_start:window_end], step_crashed[step], step_num_advances[step])
+                    window_start = window_end
+
+            if (self.num_training_inputs >= self.deep_q_learning_interval):
+                self.__push_values_into_neural_net()
+            first_step = last_step + 1
+
+
+    # We only know a state's next state once the next move has been made, so the last state we
+    # learned from waits in pending_transition until the following one comes along. A crash ends
+    # the game, so then there's nothing to wait for.
+    #
+    # A crash usually comes along before the window since the last learning step has filled up, so
+    # the windows overlap. Only the moves made since the last push are new; the rest are already in
+    # the experience replay. Every move gets its own reward: only the move that crashed gets the
+    # crash reward.
+    def __push_into_experience_replay(self, states, actions, crashed, num_advances):
+        num_new_moves = min(num_advances - self.num_advances_pushed, len(actions))
+        if (num_new_moves <= 0):
+            return
+        if (num_advances - num_new_moves != self.num_advances_pushed):
+            # Some moves fell out of the window before we got to them, so the pending state's next
+            # state is gone.
+            self.pending_transition = None
+        states = states[len(actions) - num_new_moves:]
+        actions = actions[len(actions) - num_new_moves:]
+        rewards = numpy.full(num_new_moves, self.safe_reward, dtype=numpy.float32)
+        if (crashed):
+            rewards[-1] = self.crash_reward
+        if (self.pending_transition is not None):
+            (pending_state, pending_action, pending_reward) = self.pending_transition
+            states = numpy.concatenate(([pending_state], states))
+            actions = numpy.concatenate(([pending_action], actions))
+            rewards = numpy.concatenate(([pending_reward], rewards))
+
+        if (crashed):
+            dones = numpy.zeros(len(actions), dtype=bool)
+            dones[-1] = True
+            # The last state never gets a next state. Its q value ignores it anyway.
+            next_states = numpy.concatenate((states[1:], states[-1:]))
+            self.experience_replay.push_transitions(states, actions, rewards, next_states, dones)
+            self.pending_transition = None
+            # The next game starts counting its advances from scratch.
+            self.num_advances_pushed = 0
+        else:
+            self.experience_replay.push_transitions(states[:-1], actions[:-1], rewards[:-1], states[1:],
+                numpy.zeros(len(actions) - 1, dtype=bool))
+            # The states live in the training inputs, which get overwritten, so keep a copy.
+            self.pending_transition = (states[-1].copy(), actions[-1], rewards[-1])
+            self.num_advances_pushed = num_advances
+
+
+    def __push_values_into_neural_net(self):
+        # Everything we collected is already stacked into arrays, one row per sample, so the neural
+        # network can chew through a whole minibatch in a single call.
+        num_samples = self.num_training_inputs
+        car_roads = self.training_car_roads[:num_samples]
+        actions = self.training_actions[:num_samples]
+        rewards = self.training_rewards[:num_samples]
+        q_values = self.training_q_values[:num_samples]
+        self.num_training_inputs = 0
+
+        for epoch in range(self.training_epochs):
+            # Shuffle so that each minibatch isn't just a run of consecutive moves.
+            sample_order = numpy.random.permutation(num_samples)
+            for batch_start in range(0, num_samples, self.training_batch_size):
+                batch = sample_order[batch_start:batch_start+self.training_batch_size]
+                self.train_step(car_roads[batch], actions[batch], rewards[batch], q_values[batch])
+
+        if ((self.experience_replay is not None) and (len(self.experience_replay) >= self.replay_batch_size)):
+            self.__train_from_experience_replay()
+
+        self.after_training()
+
+
+    def __train_from_experience_replay(self):
+        for batch_num in range(self.replay_batches):
+            (states, actions, rewards, next_states, dones, indices, weights) = self.experience_replay.sample(self.replay_batch_size)
+            td_errors = self.__train_on_transitions(states, actions, rewards, next_states, dones, weights)
+            self.experience_replay.update_priorities(indices, td_errors)
+
+
+    # One training step on a minibatch of transitions, with the usual Q-learning target. Returns the
+    # temporal difference errors, for prioritized experience replay.
+    def __train_on_transitions(self, states, actions, rewards, next_states, dones, importance_weights=None):
+        # One trip through the neural network gets the q values for both the states and the
+        # states that followed them.
+        q_values = self.predict_q_values(numpy.concatenate((states, next_states)))
+        next_q_values = q_values[len(states):]
+        q_values = q_values[:len(states)]
+
+        # The best we can do from the next state, unless there isn't one because we crashed.
+        max_next_q_values = next_q_values.max(axis=1) * (~dones)
+
+        # train_step sets the target for the chosen action to
+        # reward + gamma * q_prime[action] and leaves the others alone. Putting the best next
+        # q value in the chosen action's slot turns that into the usual Q-learning target.
+        batch_indices = numpy.arange(len(states))
+        q_prime = q_values.copy()
+        q_prime[batch_indices, actions] = max_next_q_values
+        td_errors = rewards + (self.gamma * max_next_q_values) - q_values[batch_indices, actions]
+
+        self.train_step(states, actions, rewards, q_prime, importance_weights)
+
+        return td_errors
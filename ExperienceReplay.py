@@ -1,32 +1,123 @@
+import numpy
+
+
+"""Experience replay memory. Everything lives in preallocated arrays that are written in a circle,
+so pushing is O(1) and the memory used is fixed by max_history. There are two kinds of memories:
+
+-Crash snapshots: the last few game states before a crash. The game replays the latest one at the
+  start of the next game, so the car gets another go at whatever did it in.
+-Transitions: (state, action, reward, next state, done) tuples, already encoded by a brain. These
+  are sampled uniformly in minibatches, which breaks up the correlation between consecutive moves.
+
+A brain that wants transitions would normally create its own ExperienceReplay, with its own
+max_history, rather than share the game's."""
 class ExperienceReplay:
 
 
-    def __init__(self, max_history, max_snapshot):
-        self.experience_replay_history = []
+    def __init__(self, max_history, max_snapshot, seed=None):
         self.future_road = []
         self.max_history = max_history
         self.max_snapshot = max_snapshot
+        # Without a seed, take one from numpy's global random numbers, so that seeding those is enough
+        # to make a run repeatable.
+        if (seed is None):
+            seed = numpy.random.randint(2**31)
+        self.random_generator = numpy.random.default_rng(seed)
+
+        self.clear()
+
+
+    def clear(self):
+        # The arrays are allocated on the first push, once we know how big a road or a state is.
+        self.snapshot_roads = None
+        self.num_snapshots = 0
+        self.latest_snapshot = -1
+
+        self.states = None
+        self.num_transitions = 0
+        self.next_transition = 0
+
+
+    def __len__(self):
+        return self.num_transitions
 
 
     def is_empty(self):
-        return (len(self.experience_replay_history) == 0)
+        return (self.num_snapshots == 0)
 
 
+    # Returns the car position and road at the start of the latest snapshot, along with the new
+    # road sections that scrolled onto the screen after it.
     def pop(self):
-        snapshot = self.experience_replay_history[0]
-        current_state = snapshot[0]
-        car_position = current_state[1]
-        road = current_state[0].copy()
-        if (len(snapshot) > 0):
-            return (car_position, road, snapshot[1:])
-        else:
-            return (car_position, road, None)
+        snapshot_length = self.snapshot_lengths[self.latest_snapshot]
+        roads = self.snapshot_roads[self.latest_snapshot, :snapshot_length]
+        car_position = int(self.snapshot_car_positions[self.latest_snapshot, 0])
+        road = roads[0].tolist()
+        future_road = roads[1:, -1].tolist()
+        return (car_position, road, future_road)
 
 
     def push(self, recent_road_states):
-        snapshot = []
-        for recent_state in recent_road_states[-self.max_snapshot:]:
-            snapshot.append(recent_state)
-        self.experience_replay_history.insert(0, snapshot)
-        if (len(self.experience_replay_history) > self.max_history):
-            self.experience_replay_history.pop()
+        # The window is a view into the game's trajectory buffer, which is overwritten on the next
+        # move, so copy it into our own arrays.
+        (roads, car_positions, actions) = recent_road_states.window(self.max_snapshot)
+        if (self.snapshot_roads is None):
+            self.snapshot_roads = numpy.zeros((self.max_history, self.max_snapshot, roads.shape[1]), dtype=roads.dtype)
+            self.snapshot_car_positions = numpy.zeros((self.max_history, self.max_snapshot), dtype=car_positions.dtype)
+            self.snapshot_actions = numpy.zeros((self.max_history, self.max_snapshot), dtype=actions.dtype)
+            self.snapshot_lengths = numpy.zeros(self.max_history, dtype=numpy.int64)
+
+        snapshot_length = len(actions)
+        self.latest_snapshot = (self.latest_snapshot + 1) % self.max_history
+        self.snapshot_roads[self.latest_snapshot, :snapshot_length] = roads
+        self.snapshot_car_positions[self.latest_snapshot, :snapshot_length] = car_positions
+        self.snapshot_actions[self.latest_snapshot, :snapshot_length] = actions
+        self.snapshot_lengths[self.latest_snapshot] = snapshot_length
+        self.num_snapshots = min(self.num_snapshots + 1, self.max_history)
+
+
+    def push_transition(self, state, action, reward, next_state, done):
+        self.push_transitions([state], [action], [reward], [next_state], [done])
+
+
+    # Pushes several transitions at once. Each argument has one entry per transition.
+    def push_transitions(self, states, actions, rewards, next_states, dones):
+        states = numpy.asarray(states, dtype=numpy.float32)
+        if (self.states is None):
+            state_size = states.shape[1]
+            self.states = numpy.zeros((self.max_history, state_size), dtype=numpy.float32)
+            self.actions = numpy.zeros(self.max_history, dtype=numpy.int64)
+            self.rewards = numpy.zeros(self.max_history, dtype=numpy.float32)
+            self.next_states = numpy.zeros((self.max_history, state_size), dtype=numpy.float32)
+            self.dones = numpy.zeros(self.max_history, dtype=bool)
+
+        # Where the transitions land, wrapping around to overwrite the oldest ones.
+        indices = (self.next_transition + numpy.arange(len(states))) % self.max_history
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        self.next_transition = (self.next_transition + len(states)) % self.max_history
+        self.num_transitions = min(self.num_transitions + len(states), self.max_history)
+        return indices
+
+
+    # Returns a uniformly sampled minibatch of (states, actions, rewards, next_states, dones,
+    # indices, weights). Every transition is equally likely here, so the importance sampling
+    # weights are all 1. They are only returned so that this can be swapped for a
+    # PrioritizedExperienceReplay without changing the brain.
+    def sample(self, batch_size):
+        indices = self.random_generator.integers(0, self.num_transitions, batch_size)
+        (states, actions, rewards, next_states, dones) = self.transitions(indices)
+        return (states, actions, rewards, next_states, dones, indices, numpy.ones(batch_size, dtype=numpy.float32))
+
+
+    # Uniform sampling doesn't care how well the brain did on a transition.
+    def update_priorities(self, indices, td_errors):
+        pass
+
+
+    def transitions(self, indices):
+        return (self.states[indices], self.actions[indices], self.rewards[indices], \
+            self.next_states[indices], self.dones[indices])
@@ -0,0 +1,38 @@
+"""Plays by a fixed policy, from a brain's get_policy(), and never learns anything: the moves are
+passed through to the brain, but on_after_move() never reaches it. Random moves are turned off, and
+the neural brains either always take the action their network likes best (greedy) or sample one
+from it, the way they do while learning. QValueBrain is always greedy."""
+class FrozenBrain:
+
+
+    def __init__(self, brain, policy, greedy=True):
+        self.brain = brain
+        self.policy = policy
+        # Hand the policy over before the first series too, so that a brain that would otherwise work
+        # its policy out in on_series() doesn't have to.
+        self.brain.set_policy(policy)
+        self.brain.random_move_probability = 0
+        if (hasattr(self.brain, 'numpy_policy')):
+            self.brain.numpy_policy.greedy = greedy
+
+
+    def on_series(self, num_lanes):
+        self.brain.on_series(num_lanes)
+        # A new series may have started the brain over from scratch.
+        self.brain.set_policy(self.policy)
+
+
+    def on_before_move(self, car_position, current_road_section, road):
+        return self.brain.on_before_move(car_position, current_road_section, road)
+
+
+    def on_after_move(self, action, crashed, num_advances, recent_road_states):
+        pass
+
+
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        pass
+
+
+    def get_stats(self):
+        return self.brain.get_stats()
@@ -0,0 +1,116 @@
+import time
+
+
+"""Keeps track of where the time goes while GameStructure plays. Hand one to GameStructure and it
+times every phase of the game loop -- making the road, the brain deciding, recording the game
+state, the brain learning and drawing (sleeps included) -- along with each of the brain's
+callbacks, and the moves and games as a whole. The phases nest: a game is made up of rows of road
+and moves, and a move includes the brain's calls, recording and drawing. Without a profiler,
+nothing is timed and nothing is slowed down.
+
+The timers keep counting for the whole run. At the end of every series, the calls and seconds spent
+in each phase during that series are added to series_summaries and, if print_summaries is set,
+printed.
+
+For a closer look, a sampling profiler (or any other profiler) can be run over just some of the
+games: start_profiler and stop_profiler are called as the games in road_widths and game_numbers
+start and end. For example, with profile = cProfile.Profile(), pass profile.enable and
+profile.disable. Leaving road_widths or game_numbers as None means every road width or every game
+number."""
+class GameProfiler:
+
+
+    PHASES = ['game', 'move', 'road', 'on_before_move', 'record', 'on_after_move', 'draw', 'on_crashed', 'on_series']
+
+
+    def __init__(self, print_summaries=True, start_profiler=None, stop_profiler=None, road_widths=None, \
+            game_numbers=None):
+        self.print_summaries = print_summaries
+        self.start_profiler = start_profiler
+        self.stop_profiler = stop_profiler
+        self.road_widths = road_widths
+        self.game_numbers = game_numbers
+        self.profiling = False
+
+        self.calls = dict.fromkeys(self.PHASES, 0)
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.series_start_calls = dict(self.calls)
+        self.series_start_seconds = dict(self.seconds)
+        self.series_summaries = []
+
+
+    # Wraps function so that every call to it counts towards phase.
+    def timed(self, phase, function):
+        calls = self.calls
+        seconds = self.seconds
+        perf_counter = time.perf_counter
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            seconds[phase] += perf_counter() - start
+            calls[phase] += 1
+            return result
+        return timed_function
+
+
+    def profile_brain(self, brain):
+        return ProfiledBrain(self, brain)
+
+
+    # Called by GameStructure as each game starts, to start or stop the profiler.
+    def on_game(self, road_width, game_number):
+        profile = ((self.start_profiler is not None) \
+            and ((self.road_widths is None) or (road_width in self.road_widths)) \
+            and ((self.game_numbers is None) or (game_number in self.game_numbers)))
+        if (profile and (not self.profiling)):
+            self.start_profiler()
+            self.profiling = True
+        elif ((not profile) and self.profiling):
+            self.stop_profiler()
+            self.profiling = False
+
+
+    # Called by GameStructure as each series ends.
+    def on_series_end(self, road_width, num_games):
+        if (self.profiling):
+            self.stop_profiler()
+            self.profiling = False
+
+        summary = {'road_width': road_width, 'num_games': num_games, 'phases': {}}
+        for phase in self.PHASES:
+            summary['phases'][phase] = {'calls': self.calls[phase] - self.series_start_calls[phase],
+                'seconds': self.seconds[phase] - self.series_start_seconds[phase]}
+        self.series_summaries.append(summary)
+        self.series_start_calls = dict(self.calls)
+        self.series_start_seconds = dict(self.seconds)
+
+        if (self.print_summaries):
+            self.print_summary(summary)
+
+
+    def print_summary(self, summary):
+        game_seconds = summary['phases']['game']['seconds']
+        print('Road width: {0}, games: {1}, seconds: {2:.3f}.'.format(summary['road_width'], summary['num_games'], \
+            game_seconds))
+        print('{0:>16} {1:>12} {2:>12} {3:>12} {4:>8}'.format('phase', 'calls', 'seconds', 'us/call', 'share'))
+        for (phase, timings) in summary['phases'].items():
+            microseconds_per_call = (1e6 * timings['seconds'] / timings['calls']) if (timings['calls'] > 0) else 0
+            share = (timings['seconds'] / game_seconds) if (game_seconds > 0) else 0
+            print('{0:>16} {1:>12} {2:>12.3f} {3:>12.2f} {4:>7.1%}'.format(phase, timings['calls'], \
+                timings['seconds'], microseconds_per_call, share))
+
+
+"""Passes every call through to the brain, timing each one."""
+class ProfiledBrain:
+
+
+    def __init__(self, game_profiler, brain):
+        self.brain = brain
+        self.on_series = game_profiler.timed('on_series', brain.on_series)
+        self.on_before_move = game_profiler.timed('on_before_move', brain.on_before_move)
+        self.on_after_move = game_profiler.timed('on_after_move', brain.on_after_move)
+        self.on_crashed = game_profiler.timed('on_crashed', brain.on_crashed)
+
+
+    def get_stats(self):
+        return self.brain.get_stats()
@@ -1,6 +1,7 @@
-import random
 import time
 from ExperienceReplay import ExperienceReplay
+from RoadTape import RoadTape
+from TrajectoryBuffer import TrajectoryBuffer
 
 
 """This class handles all the details of the game; drawing the screen, maintaining data
@@ -10,7 +11,9 @@ class GameStructure:
 
     def __init__(self, starting_road_width, ending_road_width, num_advances_level_complete, \
             display_rate, random_obstacle_probability, max_number_display_road_states, \
-            max_number_road_states, advances_learning_interval, max_history, fast_mode):
+            max_number_road_states, advances_learning_interval, max_history, fast_mode, \
+            headless=False, progress_callback=None, road_seed=None, road_tapes=None, profiler=None, \
+            telemetry=None, renderer=None, recorder=None, keep_road_tapes=False):
         self.starting_road_width = starting_road_width
         self.ending_road_width = ending_road_width
         self.num_advances_level_complete = num_advances_level_complete
@@ -22,6 +25,41 @@ class GameStructure:
         self.advances_learning_interval = advances_learning_interval
         self.max_history = max_history
         self.fast_mode = fast_mode
+        # Headless mode never draws and never sleeps, not even for every xth game, so batch
+        # training runs at full speed. Progress is kept in cheap counters instead, and is also
+        # handed to progress_callback(road_width, game_number, num_advances, max_advances) after
+        # every crash, if one is given.
+        self.headless = headless
+        self.progress_callback = progress_callback
+        # The roads come off a RoadTape per road width. road_tapes can hand in tapes for some or all
+        # of the road widths, e.g. ones loaded from a file, keyed by road width. The rest are made
+        # as needed, from road_seed plus the road width if road_seed is given, and added to
+        # road_tapes. Only with keep_road_tapes do they hang on to every row played, so that they
+        # can be saved afterwards.
+        self.road_seed = road_seed
+        self.road_tapes = {} if (road_tapes is None) else road_tapes
+        self.keep_road_tapes = keep_road_tapes
+        # Optional. A GameProfiler that times each phase of the game. The phases are timed by swapping
+        # in timed versions of the methods, so there's no cost at all without one.
+        self.profiler = profiler
+        if (self.profiler is not None):
+            self.__play_game = self.profiler.timed('game', self.__play_game)
+            self.__move = self.profiler.timed('move', self.__move)
+            self.__create_next_road_section = self.profiler.timed('road', self.__create_next_road_section)
+            self.__update_recent_road_states = self.profiler.timed('record', self.__update_recent_road_states)
+            self.__scroll = self.profiler.timed('draw', self.__scroll)
+        # Optional. A TelemetryWriter that gets a record after every game and every series, along
+        # with the brain's get_stats().
+        self.telemetry = telemetry
+        # Optional. A TerminalRenderer that draws the game on a thread of its own instead. The game
+        # then never draws or sleeps itself, and the brains are told to keep quiet too.
+        self.renderer = renderer
+        # Optional. A TrajectoryRecorder that every move of every game is written to.
+        self.recorder = recorder
+        self.num_games_played = 0
+        self.num_total_advances = 0
+        # One entry per road width played: road_width, num_games, num_advances and seconds.
+        self.series_results = []
 
         self.DEBUG_FIXED_OBSTACLES = False
         self.DISPLAY_EVERY_XTH_GAME = 500
@@ -29,30 +67,69 @@ class GameStructure:
 
 
     def start(self, brain):
-        self.brain = brain
-        # Learn how to drive the three lane road. Then add a lane, and then another.
-        for road_width in range(self.starting_road_width, self.ending_road_width):
-            self.road_width = road_width
-            self.empty_road_section = [' '] * self.road_width
-            self.empty_road_section[0] = '|'
-            self.empty_road_section[-1] = '|'
-            self.game_number = -1
-            # Keep track of each advance, so that we know how well we are learning.
-            self.num_advances = 0
-            self.num_advances_for_road_width = 0
-            self.__play_series()
+        self.brain = brain if (self.profiler is None) else self.profiler.profile_brain(brain)
+        self.stopped = False
+        if (self.renderer is not None):
+            self.renderer.start()
+        try:
+            # Learn how to drive the three lane road. Then add a lane, and then another.
+            for road_width in range(self.starting_road_width, self.ending_road_width):
+                if (self.stopped):
+                    break
+                self.road_width = road_width
+                # Each road section is an integer bitmask of its obstacles: bit 0 is set if there is
+                # a boulder in the left-most lane, bit 1 for the next lane over and so on. The curbs
+                # are implied, so an empty road section is simply 0.
+                self.empty_road_section = 0
+                self.game_number = -1
+                # Keep track of each advance, so that we know how well we are learning.
+                self.num_advances = 0
+                self.num_advances_for_road_width = 0
+                self.__play_series()
+        finally:
+            if (self.renderer is not None):
+                self.renderer.stop()
 
 
     def __play_series(self):
+        start_time = time.perf_counter()
+        start_num_games_played = self.num_games_played
+        start_num_total_advances = self.num_total_advances
         self.brain.on_series(self.road_width - 2)
+        self.road_tape = self.road_tapes.get(self.road_width)
+        if (self.road_tape is None):
+            seed = None if (self.road_seed is None) else (self.road_seed + self.road_width)
+            self.road_tape = RoadTape(self.road_width - 2, self.random_obstacle_probability, seed, \
+                keep_blocks=self.keep_road_tapes)
+            self.road_tapes[self.road_width] = self.road_tape
         self.experience_replay = ExperienceReplay(self.max_history, self.advances_learning_interval)
+        # One preallocated buffer is reused for every game in the series.
+        self.recent_road_states = TrajectoryBuffer(self.max_number_road_states, self.max_number_display_road_states)
 
         # Run many games, learning to drive with each game. Once the car advances 2000 sections
         # (or whatever num_advances_level_complete is set to), consider the level completed.
-        while (self.num_advances < self.num_advances_level_complete):
+        while ((self.num_advances < self.num_advances_level_complete) and (not self.stopped)):
             self.game_number += 1
+            if (self.profiler is not None):
+                self.profiler.on_game(self.road_width, self.game_number)
             self.__play_game()
 
+        if (self.profiler is not None):
+            self.profiler.on_series_end(self.road_width, self.num_games_played - start_num_games_played)
+
+        self.series_results.append({'road_width': self.road_width, \
+            'num_games': self.num_games_played - start_num_games_played, \
+            'num_advances': self.num_total_advances - start_num_total_advances, \
+            'seconds': time.perf_counter() - start_time})
+        if (self.telemetry is not None):
+            self.__write_telemetry('series', self.series_results[-1])
+
+
+    # Ends training once the current game is over, whether or not the level has been completed.
+    # Handy from progress_callback.
+    def stop(self):
+        self.stopped = True
+
 
     def __play_game(self):
         # Keep track of each advance, so that we know how well we are learning.
@@ -61,10 +138,10 @@ class GameStructure:
         # This keeps the last several states -- that is, the way the road looked, the car
         # position and the action taken. In the event of a crash, we go back and learn from
         # them. This is known as reinforcement learning.
-        self.recent_road_states = []
+        self.recent_road_states.clear()
 
         # Start with the car in the middle of the road (or close to it).
-        self.car_position = ((self.road_width - 2) // 2) + 1
+        self.car_position = self.starting_car_position(self.road_width)
 
         # Start with the car driving straight down the road, not to the left or right.
         self.action = 0
@@ -89,16 +166,14 @@ class GameStructure:
         # The road ahead.
         self.road = []
         if (self.experience_replay.is_empty() == False):
-            (car_position, road, future_states) = self.experience_replay.pop()
+            (car_position, road, future_road) = self.experience_replay.pop()
             self.car_position = car_position
             self.road = road
-            if (future_states is not None):
-                for future_state in future_states:
-                    self.future_road.append(future_state[0][-1].copy())
+            self.future_road.extend(future_road)
         else:
             self.future_road = []
             for entrance_num in range(self.NUMBER_SECTIONS_IN_ENTRANCE):
-                self.road.append(self.empty_road_section.copy())
+                self.road.append(self.empty_road_section)
         self.__scroll()
 
 
@@ -119,15 +194,18 @@ class GameStructure:
         self.__update_recent_road_states()
 
         # Move the car.
+        previous_car_position = self.car_position
         self.car_position += self.action
 
         crashed = False
         # Crashing involves hitting either the curb or a boulder.
-        if ((current_road_section[self.car_position] == '|')
-            or (current_road_section[self.car_position] == 'O')):
+        if (self.obstacle_at(current_road_section, self.car_position, self.road_width) is not None):
                 crashed = True # Crash!
                 self.experience_replay.push(self.recent_road_states)
 
+        if (self.recorder is not None):
+            self.recorder.record(self.road_width, self.road, previous_car_position, self.action, crashed)
+
         # Call out to our brain and let it know whether we crashed.
         self.brain.on_after_move(self.action, crashed, self.num_advances, self.recent_road_states)
 
@@ -135,61 +213,96 @@ class GameStructure:
         self.__scroll(crashed)
 
         if (crashed):
-            self.brain.on_crashed(self.fast_mode, self.game_number, self.DISPLAY_EVERY_XTH_GAME, self.road_width, self.num_advances, self.num_advances_for_road_width)
+            self.num_games_played += 1
+            self.num_total_advances += self.num_advances
+            self.brain.on_crashed(self.fast_mode, self.game_number, self.DISPLAY_EVERY_XTH_GAME, self.road_width, self.num_advances, self.num_advances_for_road_width, \
+                self.headless or (self.renderer is not None))
+            if (self.progress_callback is not None):
+                self.progress_callback(self.road_width, self.game_number, self.num_advances, self.num_advances_for_road_width)
+            if (self.telemetry is not None):
+                self.__write_telemetry('game', {'road_width': self.road_width, 'game_number': self.game_number, \
+                    'num_advances': self.num_advances, 'max_advances': self.num_advances_for_road_width})
 
         return crashed
 
 
-    # Keep track of the game states.
+    def __write_telemetry(self, record_type, fields):
+        record = {'type': record_type, 'wall_time': time.time()}
+        record.update(fields)
+        record.update(self.brain.get_stats())
+        self.telemetry.write(record)
+
+
+    # The rules of the game, also played by PolicyEvaluator. The car starts in the middle of the
+    # road, or close to it.
+    @staticmethod
+    def starting_car_position(road_width):
+        return ((road_width - 2) // 2) + 1
+
+
+    CURB = 'curb'
+    BOULDER = 'boulder'
+
+
+    # Returns what the car hits at the given position in the road section -- CURB or BOULDER -- or
+    # None if it hits nothing.
+    @staticmethod
+    def obstacle_at(road_section, position, road_width):
+        if ((position <= 0) or (position >= road_width - 1)):
+            return GameStructure.CURB
+        if ((road_section >> (position - 1)) & 1):
+            return GameStructure.BOULDER
+        return None
+
+
+    # Adds a new row to the bottom of the road, dropping the top row once the road is as long as
+    # it gets.
+    @staticmethod
+    def append_road_section(road, road_section, max_number_display_road_states):
+        road.append(road_section)
+        if (len(road) > max_number_display_road_states):
+            road.pop(0)
+
+
+    # Keep track of the game states. The buffer only keeps the latest max_number_road_states.
     def __update_recent_road_states(self):
-        road_copy = []
-        for road_section in self.road:
-            road_copy.append(road_section.copy())
-        self.recent_road_states.append([road_copy, self.car_position, self.action])
-        if (len(self.recent_road_states) > self.max_number_road_states):
-            self.recent_road_states.pop(0)
+        self.recent_road_states.append(self.road, self.car_position, self.action)
 
 
     def __create_next_road_section(self):
-        curb = 1
-        road_width_without_curbs = self.road_width - 2
         if (len(self.future_road) > 0):
             next_road_section = self.future_road.pop(0)
+        elif (self.DEBUG_FIXED_OBSTACLES):
+            next_road_section = self.empty_road_section
+            spots = []
+            if (self.num_advances % 4 == 0):
+                spots = [1]
+            elif (self.num_advances % 2 == 0):
+                spots = [0, 2]
+            for spot in spots:
+                next_road_section |= 1 << spot
+            self.previous_road_section_num_obstacles = len(spots)
         else:
-            next_road_section = self.empty_road_section.copy()
-            if (self.previous_road_section_num_obstacles > 1):
-                num_obstacles_allowed_in_land_row = road_width_without_curbs - 2
-            else:
-                num_obstacles_allowed_in_land_row = road_width_without_curbs - 1
-            num_obstacles_in_road_section = 0
-            if (self.DEBUG_FIXED_OBSTACLES):
-                spots = []
-                if (self.num_advances % 4 == 0):
-                    spots = [1]
-                elif (self.num_advances % 2 == 0):
-                    spots = [0, 2]
-                for spot in spots:
-                    next_road_section[curb + spot] = 'O'
-                    num_obstacles_in_road_section += 1
-            else:
-                spots = random.sample(list(range(road_width_without_curbs)), num_obstacles_allowed_in_land_row)
-                for spot in spots:
-                    if (random.random() < self.random_obstacle_probability):
-                        next_road_section[curb + spot] = 'O'
-                        num_obstacles_in_road_section += 1
-            self.previous_road_section_num_obstacles = num_obstacles_in_road_section
-        self.road.append(next_road_section)
-        if (len(self.road) > self.max_number_display_road_states):
-            self.road.pop(0)
+            # A random lane is always left open, or two if the previous row had more than one
+            # obstacle. The tape already has the row both ways.
+            (next_road_section, self.previous_road_section_num_obstacles) = \
+                self.road_tape.next_road_section(self.previous_road_section_num_obstacles)
+        self.append_road_section(self.road, next_road_section, self.max_number_display_road_states)
 
 
     def __scroll(self, crashed = False):
+        if (self.headless):
+            return
+        if (self.renderer is not None):
+            self.renderer.update(self.road_width, self.game_number, self.num_advances, \
+                self.num_advances_for_road_width, self.car_position, crashed, self.road)
+            return
         if (self.fast_mode):
             if (self.game_number % self.DISPLAY_EVERY_XTH_GAME != 0):
                 return
         self.__scroll_screen()
         self.__draw_previous_road_sections()
-        current_road_section = self.road[0].copy()
+        current_road_section = self.__road_section_to_characters(self.road[0])
         if (crashed):
             # Draw the burning embers of the crashed car, engulfed in roiling clouds of
             # burning gasoline. Or an X. Same thing.
@@ -205,7 +318,20 @@ class GameStructure:
             time.sleep(self.display_rate)
 
 
+    # The road sections are only turned into characters when we actually draw them.
+    def __road_section_to_characters(self, road_section):
+        characters = ['|'] * self.road_width
+        for lane in range(self.road_width - 2):
+            if ((road_section >> lane) & 1):
+                characters[lane + 1] = 'O'
+            else:
+                characters[lane + 1] = ' '
+        return characters
+
+
     def __draw_road_section(self, road_section):
+        if (not isinstance(road_section, list)):
+            road_section = self.__road_section_to_characters(road_section)
         left_margin_size = (80 - len(road_section))//2 # Integer arithmetic.
         left_margin_list = [' '] * left_margin_size
         left_margin = ''.join(left_margin_list)
@@ -223,6 +349,7 @@ class GameStructure:
             # road states can grow larger than the number we wish to display. Frankly, I don't
             # recall why. If it turns out the extra states aren't needed, get rid of them and clean
             # up this code.
-            for prev_road_section in self.recent_road_states[-(self.max_number_display_road_states+1)][0]:
+            (roads, car_positions, actions) = self.recent_road_states.window(self.max_number_display_road_states+1)
+            for prev_road_section in roads[0]:
                 self.__draw_road_section(prev_road_section)
 
@@ -0,0 +1,71 @@
+import numpy
+from DeepQLearningBrain import DeepQLearningBrain
+
+
+"""The same deep Q learning as DeepQNeuralBrain, with the same 128 node neural network, the same
+squared difference loss and the same RMSProp optimizer, written in plain numpy. There is no
+tensorflow to import, so it starts up in a fraction of a second and doesn't weigh down every
+process it runs in. The neural network's weights are trained in place, so there is nothing to
+refresh after training."""
+class NumpyDeepQBrain(DeepQLearningBrain):
+
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The same settings tensorflow's RMSPropOptimizer gets in DeepQNeuralBrain, along with
+        # tensorflow's default epsilon.
+        self.LEARNING_RATE = 0.001
+        self.DECAY = 0.99
+        self.EPSILON = 1e-10
+        self.NUM_HIDDEN_NODES = 128
+
+
+    def predict_q_values(self, states):
+        return self.numpy_policy.logits(states)
+
+
+    def initialize_network(self):
+        number_states = self.state_encoder.state_size
+        number_actions = self.num_actions
+
+        # Like tensorflow's dense layers: glorot uniform kernels and biases of 0.
+        def glorot_uniform(fan_in, fan_out):
+            limit = numpy.sqrt(6 / (fan_in + fan_out))
+            return numpy.random.uniform(-limit, limit, (fan_in, fan_out)).astype(numpy.float32)
+        weights = [glorot_uniform(number_states, self.NUM_HIDDEN_NODES),
+            numpy.zeros(self.NUM_HIDDEN_NODES, dtype=numpy.float32),
+            glorot_uniform(self.NUM_HIDDEN_NODES, number_actions),
+            numpy.zeros(number_actions, dtype=numpy.float32)]
+        self.numpy_policy.set_weights(*weights)
+
+        # RMSProp keeps a running average of each weight's squared gradient. Tensorflow starts
+        # them at 1.
+        self.mean_squared_gradients = [numpy.ones_like(weight) for weight in weights]
+
+
+    # One step of RMSProp.
+    def train_step(self, car_roads, actions, rewards, q_prime, importance_weights=None):
+        (hidden_kernel, hidden_bias, logits_kernel, logits_bias) = self.numpy_policy.get_weights()
+        batch_indices = numpy.arange(len(actions))
+
+        # Forward.
+        hidden_layer = numpy.maximum(car_roads @ hidden_kernel + hidden_bias, 0)
+        q_values = hidden_layer @ logits_kernel + logits_bias
+        target_q_values = q_prime.copy()
+        target_q_values[batch_indices, actions] = rewards + (self.gamma * q_prime[batch_indices, actions])
+
+        # Backward.
+        q_value_gradients = -2 * (target_q_values - q_values) / q_values.size
+        if (importance_weights is not None):
+            q_value_gradients *= importance_weights[:, numpy.newaxis]
+        # The loss itself isn't needed to train, only to keep an eye on how the training goes.
+        self.loss = float(-0.5 * (q_value_gradients * (target_q_values - q_values)).sum())
+        hidden_layer_gradients = (q_value_gradients @ logits_kernel.T) * (hidden_layer > 0)
+        gradients = [car_roads.T @ hidden_layer_gradients, hidden_layer_gradients.sum(axis=0),
+            hidden_layer.T @ q_value_gradients, q_value_gradients.sum(axis=0)]
+
+        # Taking a walk downhill.
+        for (weight, gradient, mean_squared_gradient) in zip(self.numpy_policy.get_weights(), gradients, self.mean_squared_gradients):
+            mean_squared_gradient *= self.DECAY
+            mean_squared_gradient += (1 - self.DECAY) * gradient * gradient
+            weight -= self.LEARNING_RATE * gradient / numpy.sqrt(mean_squared_gradient + self.EPSILON)
@@ -0,0 +1,49 @@
+import numpy
+
+
+"""A copy of a neural brain's network -- one fully-connected layer of relus followed by the action
+logits -- that runs in plain numpy. Asking tensorflow for a single action costs far more in session
+overhead than the math itself, so the brains pick their moves here and only copy the weights over
+from tensorflow after they have been trained."""
+class NumpyPolicy:
+
+
+    def __init__(self, seed=None):
+        # Without a seed, take one from numpy's global random numbers, so that seeding those is enough
+        # to make a run repeatable.
+        if (seed is None):
+            seed = numpy.random.randint(2**31)
+        self.random_generator = numpy.random.default_rng(seed)
+        self.hidden_kernel = None
+        # If set, sample_action() always picks the action with the largest logit instead.
+        self.greedy = False
+
+
+    def set_weights(self, hidden_kernel, hidden_bias, logits_kernel, logits_bias):
+        self.hidden_kernel = hidden_kernel
+        self.hidden_bias = hidden_bias
+        self.logits_kernel = logits_kernel
+        self.logits_bias = logits_bias
+
+
+    def get_weights(self):
+        return (self.hidden_kernel, self.hidden_bias, self.logits_kernel, self.logits_bias)
+
+
+    # Works on a single state or on a batch of them, one per row.
+    def logits(self, car_road_states):
+        hidden_layer = numpy.maximum(car_road_states @ self.hidden_kernel + self.hidden_bias, 0)
+        return hidden_layer @ self.logits_kernel + self.logits_bias
+
+
+    # Like tensorflow's multinomial, picks an action with probability softmax(logits). Returns the
+    # action as an index (0-2), the same as tensorflow would.
+    def sample_action(self, car_road_state):
+        logits = self.logits(car_road_state)
+        if (self.greedy):
+            return int(logits.argmax())
+        probabilities = numpy.exp(logits - logits.max())
+        cumulative_probabilities = numpy.cumsum(probabilities)
+        action = numpy.searchsorted(cumulative_probabilities, \
+            self.random_generator.random() * cumulative_probabilities[-1], side='right')
+        return min(int(action), len(cumulative_probabilities) - 1)
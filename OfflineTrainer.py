@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+import numpy
+from TrajectoryReader import TrajectoryReader
+
+
+"""Trains a neural brain -- one with a train_batch() method -- from a recording made with
+TrajectoryRecorder, rather than from a game as it is played. Nothing waits on the game, so the
+brain trains as fast as it can, and it can then carry on learning in a live game from where the
+recording left off.
+
+Every recorded move becomes a transition: the state the car was in, the action it took, the
+reward (crash_reward if it crashed, safe_reward if not) and the state it ended up in, which is just
+the next recorded move unless the car crashed. The road widths are trained one after the other,
+narrowest first, with on_series() called for each, just like the game does. Each road width's
+transitions are shuffled every epoch and handed over in minibatches of batch_size.
+
+Reading the recording and encoding the states happens on a thread of its own, which keeps up to
+prefetch_batches minibatches ready, so that the brain is never kept waiting for them.
+
+Note that a brain that isn't width independent (see StateEncoder) starts over on every road width,
+so only what it learned on the last one is left at the end."""
+class OfflineTrainer:
+
+
+    def __init__(self, trajectory_path, safe_reward, crash_reward, batch_size=1024, epochs=1, prefetch_batches=8, \
+            seed=None):
+        self.trajectory_reader = TrajectoryReader(trajectory_path)
+        self.safe_reward = safe_reward
+        self.crash_reward = crash_reward
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.prefetch_batches = prefetch_batches
+        # Without a seed, take one from numpy's global random numbers, so that seeding those is
+        # enough to make a run repeatable.
+        self.seed = numpy.random.randint(2**31) if (seed is None) else seed
+        # One entry per road width trained: road_width, num_transitions, num_batches, seconds and
+        # the loss after the last minibatch.
+        self.training_results = []
+
+
+    def start(self, brain):
+        road_widths = sorted(numpy.unique(self.trajectory_reader.road_widths).tolist())
+        for road_width in road_widths:
+            self.__train_road_width(brain, road_width)
+        return self.training_results
+
+
+    def __train_road_width(self, brain, road_width):
+        start_time = time.perf_counter()
+        brain.on_series(road_width - 2)
+        if (brain.state_encoder.num_road_sections > self.trajectory_reader.num_road_sections):
+            raise ValueError('The brain sees {0} road sections, but only {1} were recorded.'.format( \
+                brain.state_encoder.num_road_sections, self.trajectory_reader.num_road_sections))
+
+        indices = self.trajectory_reader.indices(road_width)
+        batches = queue.Queue(self.prefetch_batches)
+        stop_event = threading.Event()
+        prefetcher = threading.Thread(target=self.__prefetch_batches, name='OfflineTrainer', daemon=True, \
+            args=(brain.state_encoder, indices, road_width, batches, stop_event))
+        prefetcher.start()
+
+        num_batches = 0
+        try:
+            while (True):
+                batch = batches.get()
+                if (batch is None):
+                    break
+                if (isinstance(batch, Exception)):
+                    raise batch
+                brain.train_batch(*batch)
+                num_batches += 1
+        finally:
+            # Let the prefetch thread go, should training have stopped early.
+            stop_event.set()
+            while (prefetcher.is_alive()):
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    prefetcher.join(0.01)
+
+        self.training_results.append({'road_width': road_width, 'num_transitions': len(indices), \
+            'num_batches': num_batches, 'seconds': time.perf_counter() - start_time, \
+            'loss': brain.get_stats().get('loss')})
+
+
+    # Runs on the prefetch thread. Puts (states, actions, rewards, next_states, dones) minibatches on
+    # batches, then None once they're all done, or the exception if something goes wrong.
+    def __prefetch_batches(self, state_encoder, indices, road_width, batches, stop_event):
+        try:
+            records = self.trajectory_reader.records
+            random_generator = numpy.random.default_rng(self.seed + road_width)
+            for epoch in range(self.epochs):
+                sample_order = random_generator.permutation(indices)
+                for batch_start in range(0, len(sample_order), self.batch_size):
+                    if (stop_event.is_set()):
+                        return
+                    batch = self.__transitions(state_encoder, records, sample_order[batch_start:batch_start+self.batch_size])
+                    batches.put(batch)
+            batches.put(None)
+        except Exception as exception:
+            batches.put(exception)
+
+
+    def __transitions(self, state_encoder, records, batch_indices):
+        moves = records[batch_indices]
+        # The move after the last one recorded isn't there, so it counts as the end of the game.
+        dones = moves['crashed'] | (batch_indices == len(records) - 1)
+        next_moves = records[numpy.minimum(batch_indices + 1, len(records) - 1)]
+
+        states = state_encoder.encode_batch(moves['car_position'], moves['road'])
+        # A crash ends the game, so there's no next state. Its q value is ignored anyway.
+        next_states = state_encoder.encode_batch(numpy.where(dones, moves['car_position'], next_moves['car_position']), \
+            numpy.where(dones[:, None], moves['road'], next_moves['road']))
+        # We add 1 because the brains want the action as an unsigned int (0-2), however the
+        # recording is in terms of -1, 0 and 1.
+        actions = moves['action'].astype(numpy.int64) + 1
+        rewards = numpy.where(moves['crashed'], self.crash_reward, self.safe_reward).astype(numpy.float32)
+        return (states, actions, rewards, next_states, dones)
@@ -0,0 +1,247 @@
+import time
+import numpy
+from StateEncoder import StateEncoder
+
+
+"""Drives as well as it is possible to drive, seeing what the other brains see. It never learns:
+for each road width it works out the best action for every state up front, by value iteration, and
+from then on looking up a move is a single table lookup. That makes it both a fast baseline brain
+and a yardstick for the learning brains.
+
+A state is the car's lane plus the first num_road_sections road sections, just like the other
+brains see it, and the states are numbered the way StateEncoder.pack() numbers them (without
+max_lanes or an observation_radius). The number of states is num_lanes * 2^(num_lanes *
+num_road_sections), so this only works for narrow roads: no more than MAX_STATE_BITS bits of road,
+and at least 2 road sections.
+
+The value of a state is the discounted number of advances the car can expect from it. Moving onto
+the curb or a boulder is worth nothing. Otherwise the move is worth one advance plus the discounted
+value of the next state, which is the road scrolled up by one with a new road section at the end.
+The new road section comes from the same distribution as GameStructure's: with k lanes left open,
+k being 2 if the previous road section had more than one boulder and 1 otherwise, a road section
+with the boulders b has the probability
+
+    C(num_lanes - |b|, k) / C(num_lanes, k) * p^|b| * (1 - p)^(num_lanes - k - |b|)
+
+where p is random_obstacle_probability. The states the brain sees are only exact when
+num_road_sections is the number of road sections the game has in play (its
+max_number_display_road_states); with fewer, the brain can't see the road section that decides k,
+and the actions are the best for the road sections it can see.
+
+The best actions are kept 2 bits per state -- the action plus 1 -- four states to a byte."""
+class OptimalPolicyBrain:
+
+
+    MAX_STATE_BITS = 24
+    # Ties go to staying still, then moving left.
+    ACTIONS = [0, -1, 1]
+
+
+    def __init__(self, random_obstacle_probability, num_road_sections_in_q_values, discount=0.99, tolerance=1e-6, \
+            max_iterations=10000):
+        self.random_obstacle_probability = random_obstacle_probability
+        self.num_road_sections_in_q_values = num_road_sections_in_q_values
+        self.discount = discount
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.num_lanes = None
+        # The packed best actions, keyed by the number of lanes.
+        self.action_tables = {}
+        # The numbers of lanes solved since the last call to get_policy() or get_policy_changes().
+        self.new_num_lanes = []
+        # How many rounds of value iteration each number of lanes took, and how long.
+        self.num_iterations = {}
+        self.solve_seconds = {}
+
+
+    def on_series(self, num_lanes):
+        self.num_lanes = num_lanes
+        self.state_encoder = StateEncoder(self.num_lanes, self.num_road_sections_in_q_values)
+        if (num_lanes not in self.action_tables):
+            self.action_tables[num_lanes] = self.solve(num_lanes)
+            self.new_num_lanes.append(num_lanes)
+        self.action_table = self.action_tables[num_lanes]
+
+
+    def on_before_move(self, car_position, current_road_section, road):
+        state = self.state_encoder.pack(car_position, road)
+        return ((self.action_table[state >> 2] >> ((state & 3) << 1)) & 3) - 1
+
+
+    def on_after_move(self, action, crashed, num_advances, recent_road_states):
+        pass
+
+
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        # In headless mode the game keeps track of progress itself. Never print or sleep.
+        if (headless):
+            return
+        if ((not fast_mode) or (game_number % display_frequency == 0)):
+            print("Crashed! Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.".format(road_width, game_number, num_advances, max_advances))
+            time.sleep(1)
+
+
+    # The packed best actions for every number of lanes solved so far.
+    def get_policy(self):
+        self.new_num_lanes = []
+        return self.action_tables
+
+
+    # Every road width solved so far.
+    def get_policy_road_widths(self):
+        return sorted(num_lanes + 2 for num_lanes in self.action_tables)
+
+
+    def set_policy(self, policy):
+        self.action_tables = policy
+        if (self.num_lanes in self.action_tables):
+            self.action_table = self.action_tables[self.num_lanes]
+
+
+    # The tables for the numbers of lanes solved since the last call to get_policy() or
+    # get_policy_changes(). A table never changes once it is solved.
+    def get_policy_changes(self):
+        changes = {num_lanes: self.action_tables[num_lanes] for num_lanes in self.new_num_lanes}
+        self.new_num_lanes = []
+        return changes
+
+
+    def apply_policy_changes(self, changes):
+        self.action_tables.update(changes)
+
+
+    # This brain never learns.
+    def learn_steps(self, roads, car_positions, actions, window_lengths, step_actions, step_crashed, step_num_advances):
+        pass
+
+
+    def get_stats(self):
+        return {'learning_steps': 0, 'value_iterations': self.num_iterations.get(self.num_lanes), \
+            'solve_seconds': self.solve_seconds.get(self.num_lanes)}
+
+
+    # The widest road, in lanes, with few enough states to solve.
+    def max_num_lanes(self):
+        return self.MAX_STATE_BITS // self.num_road_sections_in_q_values
+
+
+    # Value iteration for the given number of lanes. Returns the packed table of best actions.
+    #
+    # Rather than the states themselves, the values are kept for the after states: where the car is
+    # right after a move it survived, along with the road sections still ahead of it, 1 to
+    # num_road_sections - 1. That is num_lanes * 2^num_lanes times fewer values. The value of an
+    # after state is the one advance just made, plus the discounted expectation, over the next road
+    # section, of the best after state the car can move on to without crashing into road section 1.
+    # Which moves are safe only depends on the car position and road section 1, so the best after
+    # state is worked out once for each of the 8 possible sets of safe moves.
+    def solve(self, num_lanes):
+        start_time = time.perf_counter()
+        num_road_sections = self.num_road_sections_in_q_values
+        if (num_road_sections < 2):
+            raise ValueError('The best moves can only be worked out from at least 2 road sections.')
+        if (num_lanes > self.max_num_lanes()):
+            raise ValueError('{0} lanes and {1} road sections make too many states to solve.'.format(num_lanes, \
+                num_road_sections))
+        num_road_section_values = 1 << num_lanes
+        road_section_values = numpy.arange(num_road_section_values)
+        car_indices = numpy.arange(num_lanes)
+
+        num_boulders = numpy.array([bin(road_section).count('1') for road_section in road_section_values])
+        # Whether two lanes are left open in the road section after each road section.
+        two_open = (num_boulders > 1)
+        one_open_probabilities = self.__road_section_probabilities(num_lanes, 1, num_boulders)
+        two_open_probabilities = self.__road_section_probabilities(num_lanes, 2, num_boulders)
+
+        # safe_moves[action number][car_position - 1, road section] is True if the action doesn't
+        # crash the car into the curb or a boulder in the road section. safe_move_sets packs those
+        # into the set of safe actions, one bit per action number.
+        safe_moves = []
+        for action in self.ACTIONS:
+            next_car_indices = car_indices + action
+            on_road = (next_car_indices >= 0) & (next_car_indices < num_lanes)
+            boulders = (road_section_values[None, :] >> numpy.clip(next_car_indices, 0, num_lanes - 1)[:, None]) & 1
+            safe_moves.append(on_road[:, None] & (boulders == 0))
+        safe_move_sets = sum(safe_move.astype(numpy.int64) << action_number \
+            for (action_number, safe_move) in enumerate(safe_moves))
+
+        # The after state values, indexed by [car_position - 1, road section 1, ...].
+        after_state_shape = (num_lanes,) + (num_road_section_values,) * (num_road_sections - 1)
+        values = numpy.zeros(after_state_shape)
+        for iteration in range(self.max_iterations):
+            # The value of each after state moved to with each action, or -1 for off the road.
+            moved_values = [self.__shift_car(values, action, -1.0) for action in self.ACTIONS]
+            # The best of them for every set of safe actions. With none, the car crashes, which
+            # is worth nothing.
+            best_values = numpy.zeros((1 << len(self.ACTIONS),) + after_state_shape)
+            for safe_move_set in range(1, 1 << len(self.ACTIONS)):
+                best_values[safe_move_set] = numpy.maximum.reduce([moved_values[action_number] \
+                    for action_number in range(len(self.ACTIONS)) if ((safe_move_set >> action_number) & 1)])
+            # Averaged over the road section still to come, and then looked up by the set of safe
+            # moves for each car position and road section 1. The road section that decides how
+            # many lanes are left open is the last one in the after state.
+            one_open_values = (best_values @ one_open_probabilities)[safe_move_sets, car_indices[:, None]]
+            two_open_values = (best_values @ two_open_probabilities)[safe_move_sets, car_indices[:, None]]
+            new_values = 1.0 + self.discount * numpy.where(two_open, two_open_values, one_open_values)
+            change = numpy.abs(new_values - values).max()
+            values = new_values
+            if (change < self.tolerance):
+                break
+        self.num_iterations[num_lanes] = iteration + 1
+
+        # The best action in every state, a car position at a time to keep the memory down. The
+        # states are indexed by [road section 0, road section 1, ...] for each car position.
+        action_numbers = numpy.array(self.ACTIONS) + 1
+        best_actions = []
+        for car_index in car_indices:
+            best_values = numpy.full((num_road_section_values,) * num_road_sections, -1.0)
+            car_best_actions = numpy.full(best_values.shape, action_numbers[0], dtype=numpy.uint8)
+            for (action_number, action) in enumerate(self.ACTIONS):
+                if ((car_index + action < 0) or (car_index + action >= num_lanes)):
+                    continue
+                action_values = numpy.where(safe_moves[action_number][car_index].reshape((-1,) \
+                    + (1,) * (num_road_sections - 1)), values[car_index + action], -1.0)
+                better = (action_values > best_values)
+                best_values[better] = action_values[better]
+                car_best_actions[better] = action_numbers[action_number]
+            best_actions.append(car_best_actions.ravel())
+        best_actions = numpy.concatenate(best_actions)
+
+        # Four states to a byte, the first in the lowest 2 bits.
+        best_actions = numpy.concatenate((best_actions, numpy.zeros((-len(best_actions)) % 4, dtype=numpy.uint8)))
+        packed_actions = best_actions.reshape(-1, 4) << numpy.array([0, 2, 4, 6], dtype=numpy.uint8)
+        self.solve_seconds[num_lanes] = time.perf_counter() - start_time
+        # Indexing bytes gives back a plain int, which is quicker than going through numpy.
+        return numpy.bitwise_or.reduce(packed_actions, axis=1).tobytes()
+
+
+    # The values with the car moved by action, fill where that takes it off the road.
+    def __shift_car(self, values, action, fill):
+        shifted_values = numpy.full(values.shape, fill)
+        if (action < 0):
+            shifted_values[-action:] = values[:action]
+        elif (action > 0):
+            shifted_values[:-action] = values[action:]
+        else:
+            shifted_values[:] = values
+        return shifted_values
+
+
+    # The probability of every road section, given that num_open lanes are left open.
+    def __road_section_probabilities(self, num_lanes, num_open, num_boulders):
+        # A road with a single lane can only ever leave one lane open.
+        num_open = min(num_open, num_lanes)
+        p = self.random_obstacle_probability
+        num_free = num_lanes - num_boulders
+        # The number of ways of picking the open lanes from the lanes without a boulder.
+        ways = numpy.array([self.__choose(free, num_open) for free in num_free], dtype=numpy.float64)
+        exponents = numpy.maximum(num_free - num_open, 0)
+        return ways / self.__choose(num_lanes, num_open) * (p ** num_boulders) * ((1 - p) ** exponents)
+
+
+    def __choose(self, n, k):
+        if ((k < 0) or (k > n)):
+            return 0
+        result = 1
+        for i in range(k):
+            result = result * (n - i) // (i + 1)
+        return result
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+import time
+import numpy
+from FrozenBrain import FrozenBrain
+from GameStructure import GameStructure
+from RoadTape import RoadTape
+
+
+"""Measures how well a policy -- from a brain's get_policy() -- drives, without the brain learning
+anything along the way. Every road width gets num_games independent games, game number i played on
+the roads from seed first_seed + i, so every policy is measured on exactly the same roads. A game
+ends when the car crashes or when it survives max_advances advances.
+
+The games are spread over a pool of processes, each with its own copy of the brain, made by
+brain_factory and frozen with FrozenBrain. brain_factory has to be picklable, such as a
+module-level function or a functools.partial of one.
+
+The games are played by GameStructure's rules -- where the car starts, what it crashes into and how
+the road scrolls -- except that they don't start off on the road the last game crashed on, and
+nothing is drawn. Each process seeds its own random number generators, for brains that aren't
+greedy, from first_seed and the order the processes started in. For each road width, evaluate() reports the mean,
+median and 10th percentile of the advances, how many games survived, and how many crashed into the
+curb and how many into a boulder.
+
+A policy from a brain that isn't width independent (see StateEncoder) only fits the road width it
+was learned on."""
+class PolicyEvaluator:
+
+
+    def __init__(self, road_widths, num_games, max_advances, random_obstacle_probability, \
+            max_number_display_road_states, num_processes=None, first_seed=0, greedy=True):
+        self.road_widths = list(road_widths)
+        self.num_games = num_games
+        self.max_advances = max_advances
+        self.random_obstacle_probability = random_obstacle_probability
+        self.max_number_display_road_states = max_number_display_road_states
+        # None uses every core on the box.
+        self.num_processes = multiprocessing.cpu_count() if (num_processes is None) else num_processes
+        self.first_seed = first_seed
+        self.greedy = greedy
+
+
+    # Returns one entry per road width.
+    def evaluate(self, brain_factory, policy):
+        # Enough chunks of games per road width to keep every process busy to the end, but not so
+        # many that handing them out costs more than playing them.
+        num_chunks = min(self.num_games, 4 * self.num_processes)
+        seed_chunks = numpy.array_split(numpy.arange(self.first_seed, self.first_seed + self.num_games), num_chunks)
+        game_settings = (self.max_advances, self.random_obstacle_probability, self.max_number_display_road_states)
+
+        results = []
+        context = multiprocessing.get_context('spawn')
+        # Every process takes the next number off this as it starts.
+        num_evaluators_started = context.Value('i', 0)
+        with context.Pool(self.num_processes, initializer=start_evaluator, \
+                initargs=(brain_factory, policy, self.greedy, self.first_seed, num_evaluators_started)) as pool:
+            for road_width in self.road_widths:
+                start_time = time.perf_counter()
+                chunks = pool.starmap(play_games, [(road_width, seeds.tolist(), game_settings) for seeds in seed_chunks])
+                advances = numpy.concatenate([chunk[0] for chunk in chunks])
+                crashed = numpy.concatenate([chunk[1] for chunk in chunks])
+                crashed_into_curb = numpy.concatenate([chunk[2] for chunk in chunks])
+                results.append({'road_width': road_width, 'num_games': len(advances), \
+                    'mean_advances': float(advances.mean()), 'median_advances': float(numpy.median(advances)), \
+                    'p10_advances': float(numpy.percentile(advances, 10)), 'num_survived': int((~crashed).sum()), \
+                    'crashes': {'curb': int(crashed_into_curb.sum()), 'boulder': int((crashed & ~crashed_into_curb).sum())}, \
+                    'seconds': time.perf_counter() - start_time})
+        return results
+
+
+    @staticmethod
+    def print_results(results):
+        print('{0:>10} {1:>8} {2:>10} {3:>10} {4:>10} {5:>9} {6:>7} {7:>8}'.format('road width', 'games', 'mean', \
+            'median', 'p10', 'survived', 'curb', 'boulder'))
+        for result in results:
+            print('{0:>10} {1:>8} {2:>10.1f} {3:>10.1f} {4:>10.1f} {5:>9} {6:>7} {7:>8}'.format(result['road_width'], \
+                result['num_games'], result['mean_advances'], result['median_advances'], result['p10_advances'], \
+                result['num_survived'], result['crashes']['curb'], result['crashes']['boulder']))
+
+
+# Runs once in every process of the pool, making the frozen brain its games are played with.
+def start_evaluator(brain_factory, policy, greedy, first_seed, num_evaluators_started):
+    global frozen_brain
+    with num_evaluators_started.get_lock():
+        evaluator_number = num_evaluators_started.value
+        num_evaluators_started.value += 1
+    seed = int(numpy.random.SeedSequence([first_seed, evaluator_number]).generate_state(1)[0])
+    random.seed(seed)
+    numpy.random.seed(seed)
+    frozen_brain = FrozenBrain(brain_factory(), policy, greedy)
+
+
+# Plays a game on the given road width for each seed. Returns how many advances each game got,
+# whether it crashed and whether that was into the curb rather than a boulder.
+def play_games(road_width, seeds, game_settings):
+    (max_advances, random_obstacle_probability, max_number_display_road_states) = game_settings
+    num_lanes = road_width - 2
+    frozen_brain.on_series(num_lanes)
+
+    advances = numpy.zeros(len(seeds), dtype=numpy.int64)
+    crashed = numpy.zeros(len(seeds), dtype=bool)
+    crashed_into_curb = numpy.zeros(len(seeds), dtype=bool)
+    for (game_number, seed) in enumerate(seeds):
+        # No game needs more rows than it can advance.
+        road_tape = RoadTape(num_lanes, random_obstacle_probability, seed, block_size=min(max_advances, 10000))
+        road = [0] * GameStructure.NUMBER_SECTIONS_IN_ENTRANCE
+        car_position = GameStructure.starting_car_position(road_width)
+        previous_road_section_num_obstacles = 0
+        num_advances = 0
+        while (num_advances < max_advances):
+            (road_section, previous_road_section_num_obstacles) = road_tape.next_road_section(previous_road_section_num_obstacles)
+            GameStructure.append_road_section(road, road_section, max_number_display_road_states)
+
+            num_advances += 1
+            current_road_section = road[0]
+            car_position += frozen_brain.on_before_move(car_position, current_road_section, road)
+            # Crashing involves hitting either the curb or a boulder.
+            obstacle = GameStructure.obstacle_at(current_road_section, car_position, road_width)
+            if (obstacle is not None):
+                crashed[game_number] = True
+                crashed_into_curb[game_number] = (obstacle == GameStructure.CURB)
+                break
+        advances[game_number] = num_advances
+    return (advances, crashed, crashed_into_curb)
@@ -0,0 +1,60 @@
+import numpy
+from ExperienceReplay import ExperienceReplay
+from SumTree import SumTree
+
+
+"""Experience replay that samples transitions in proportion to how wrong the brain was about them
+(their temporal difference, or TD, error) rather than uniformly. Crashes are rare next to safe
+advances, but they are exactly the transitions the brain gets most wrong, so they come up far more
+often than they would otherwise. The priorities live in a sum-tree, so sampling and updating stay
+O(log n) no matter how large the memory gets.
+
+alpha controls how much the priorities matter (0 is uniform sampling), and beta how much the
+importance sampling weights undo the resulting bias (1 undoes it completely)."""
+class PrioritizedExperienceReplay(ExperienceReplay):
+
+
+    def __init__(self, max_history, max_snapshot, alpha=0.6, beta=0.4, epsilon=0.001, seed=None):
+        super().__init__(max_history, max_snapshot, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.sum_tree = SumTree(max_history)
+        self.max_priority = 1.0
+
+
+    def clear(self):
+        super().clear()
+        self.sum_tree = SumTree(self.max_history)
+        self.max_priority = 1.0
+
+
+    def push_transitions(self, states, actions, rewards, next_states, dones):
+        indices = super().push_transitions(states, actions, rewards, next_states, dones)
+        # New transitions haven't been looked at yet, so make sure they are sampled at least once
+        # by giving them the highest priority seen so far.
+        self.sum_tree.update(indices, self.max_priority)
+        return indices
+
+
+    def sample(self, batch_size):
+        # Split the total priority into batch_size equal segments and pick one value at random
+        # from each. This spreads the minibatch out over the whole memory.
+        segment_size = self.sum_tree.total() / batch_size
+        values = (numpy.arange(batch_size) + self.random_generator.random(batch_size)) * segment_size
+        indices = numpy.minimum(self.sum_tree.find(values), self.num_transitions - 1)
+
+        # Transitions sampled more often than uniform sampling would get smaller weights, so the
+        # updates they cause are toned down to match.
+        probabilities = self.sum_tree.priorities(indices) / self.sum_tree.total()
+        weights = (self.num_transitions * probabilities) ** -self.beta
+        weights /= weights.max()
+
+        (states, actions, rewards, next_states, dones) = self.transitions(indices)
+        return (states, actions, rewards, next_states, dones, indices, weights.astype(numpy.float32))
+
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (numpy.abs(td_errors) + self.epsilon) ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.sum_tree.update(indices, priorities)
@@ -0,0 +1,112 @@
+import warnings
+import numpy
+
+
+"""A tape of road sections, made ahead of time in large blocks rather than one row at a time while
+the game is playing.
+
+The rows follow the same rules as GameStructure always has: a random lane -- or two, if the previous
+row had more than one obstacle -- is always left open, and every other lane gets a boulder with
+random_obstacle_probability. Which of the two applies isn't known until the previous row has been
+played, so every position on the tape holds both versions of the row: one with a single lane left
+open and, from the same random numbers, one with a second lane left open as well. Picking the lanes
+left open is done by drawing a random key per lane and leaving open the lanes with the smallest one
+or two keys.
+
+Given a seed, the roads are the same every time. A tape can be saved to a .npy file and loaded
+again, so different brains can be compared on the same roads. A loaded tape starts over from the
+beginning, with a RuntimeWarning, if a game plays past its end, since the roads from then on are
+ones already played; a generated one simply makes another block. Only a tape
+made with keep_blocks holds on to its old blocks, and only such a tape can be saved; otherwise
+just the block in play is kept, however long the game goes on."""
+class RoadTape:
+
+
+    # road_sections, if given, is a tape that has already been made, as returned by load(). No new
+    # rows are made for it, and its one block is always kept.
+    def __init__(self, num_lanes, random_obstacle_probability, seed=None, block_size=10000, road_sections=None, \
+            keep_blocks=False):
+        self.num_lanes = num_lanes
+        self.random_obstacle_probability = random_obstacle_probability
+        self.block_size = block_size
+        # Everything made so far, one (block_size, 2) array per block, for saving.
+        self.keep_blocks = keep_blocks or (road_sections is not None)
+        self.blocks = []
+
+        if (road_sections is not None):
+            self.random_generator = None
+            self.__use_block(numpy.asarray(road_sections, dtype=numpy.int64))
+            return
+        # Without a seed, take one from numpy's global random numbers, so that seeding those is
+        # enough to make a run repeatable.
+        if (seed is None):
+            seed = numpy.random.randint(2**31)
+        self.random_generator = numpy.random.default_rng(seed)
+        self.__next_block()
+
+
+    # Returns the next road section, as a bitmask of its obstacles, and how many obstacles it has.
+    def next_road_section(self, previous_road_section_num_obstacles):
+        if (self.position == len(self.road_sections)):
+            self.__next_block()
+        position = self.position
+        self.position += 1
+        if (previous_road_section_num_obstacles > 1):
+            return (self.road_sections_two_open[position], self.num_obstacles_two_open[position])
+        return (self.road_sections[position], self.num_obstacles[position])
+
+
+    # Saves every row made so far. Each row of the saved array holds the road section with one lane
+    # left open, then the one with two.
+    def save(self, path):
+        if (not self.keep_blocks):
+            raise ValueError('Only a road tape made with keep_blocks can be saved.')
+        numpy.save(path, numpy.concatenate(self.blocks))
+
+
+    @staticmethod
+    def load(path, num_lanes, random_obstacle_probability):
+        blocks = numpy.load(path)
+        if ((blocks.ndim != 2) or (blocks.shape[1] != 2) or (len(blocks) == 0)):
+            raise ValueError('{0} is not a road tape.'.format(path))
+        if (blocks.max() >= (1 << num_lanes)):
+            raise ValueError('{0} was made for a road with more than {1} lanes.'.format(path, num_lanes))
+        return RoadTape(num_lanes, random_obstacle_probability, road_sections=blocks)
+
+
+    def __next_block(self):
+        if (self.random_generator is None):
+            # A loaded tape has nothing more to give, so start it over, but say so: the roads
+            # from here on are repeats, and a brain may have learned them by heart.
+            warnings.warn('The {0} lane road tape ran out after {1} rows and is starting over.'.format( \
+                self.num_lanes, len(self.road_sections)), RuntimeWarning, stacklevel=3)
+            self.position = 0
+            return
+
+        self.__use_block(RoadTape.make_rows(self.random_generator, self.block_size, self.num_lanes, \
+            self.random_obstacle_probability))
+
+
+    # Makes num_rows positions' worth of road, as a (num_rows, 2) array: each row holds the road
+    # section with one lane left open, then the one with two. VectorGameStructure makes its roads
+    # with this too, a row per game at a time.
+    @staticmethod
+    def make_rows(random_generator, num_rows, num_lanes, random_obstacle_probability):
+        lane_bits = 1 << numpy.arange(num_lanes, dtype=numpy.int64)
+        lane_keys = random_generator.random((num_rows, num_lanes))
+        sorted_lane_keys = numpy.sort(lane_keys, axis=1)
+        boulders = random_generator.random((num_rows, num_lanes)) < random_obstacle_probability
+        one_open = boulders & (lane_keys > sorted_lane_keys[:, :1])
+        two_open = boulders & (lane_keys > sorted_lane_keys[:, min(1, num_lanes - 1), None])
+        return numpy.stack(((one_open * lane_bits).sum(axis=1), (two_open * lane_bits).sum(axis=1)), axis=1)
+
+
+    def __use_block(self, block):
+        if (self.keep_blocks):
+            self.blocks.append(block)
+        # Plain Python lists are the quickest to take one item at a time from.
+        self.road_sections = block[:, 0].tolist()
+        self.road_sections_two_open = block[:, 1].tolist()
+        self.num_obstacles = [bin(road_section).count('1') for road_section in self.road_sections]
+        self.num_obstacles_two_open = [bin(road_section).count('1') for road_section in self.road_sections_two_open]
+        self.position = 0
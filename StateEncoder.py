@@ -0,0 +1,145 @@
+import numpy
+
+
+"""Turns the car position and the road ahead into the list of 0s and 1s the brains learn from.
+
+What information needs to be stored? The car position, the road and any obstacles. Here's how the
+structure looks:
+|n|n|n  |n|n|n |n|n|n |n|n|n
+ car          roadway
+
+If the car is on the left side of the road, the left-most number will be 1. In the middle, the
+second number will be 1 and on the right side of the road, the third will be set. The numbers for
+the roadway will be all 0s for a roadway with no obstacles. If there is 1 obstacle, then a 1 will
+be set describing its position.
+
+For example, a car on the right of the road that comes across a boulder similarly on the road but
+two spots away will have a state like this:
+
+|0|0|1  |0|0|0 |0|0|0 |0|0|1
+
+Every road section is already a bitmask of its obstacles, so each one is only ever spread out into
+0s and 1s once; after that its encoding comes out of a cache. Building a state is then just copying
+a handful of cached rows into a buffer that is reused from one move to the next.
+
+If max_lanes is given, every state is laid out as if the road had max_lanes lanes, with the lanes
+past the right-hand curb marked as obstacles -- which, as far as the car is concerned, they are.
+The states are then the same size for every road width up to max_lanes, so a brain can carry what
+it learned on a narrow road over to a wider one.
+
+If observation_radius is given instead, the car only looks at the observation_radius lanes on either
+side of itself. Every road section becomes a window of 2*observation_radius + 1 numbers centred on
+the car, with the curbs and anything past them marked as obstacles. Where the car is on the road is
+then given away by where the curbs show up, so the car part of the state is dropped. The states are
+the same size whatever the road width, which keeps the networks small and the q-table learnable on
+even the widest roads, and what is learned carries over from one width to the next. Here's the
+state for the example above with an observation_radius of 1:
+
+|0|0|1 |0|0|1 |0|1|1
+   roadway"""
+class StateEncoder:
+
+
+    def __init__(self, num_lanes, num_road_sections, max_lanes=None, observation_radius=None):
+        if ((max_lanes is not None) and (observation_radius is None) and (num_lanes > max_lanes)):
+            raise ValueError('The road has {0} lanes, more than max_lanes ({1}).'.format(num_lanes, max_lanes))
+        self.num_lanes = num_lanes
+        self.num_road_sections = num_road_sections
+        self.observation_radius = observation_radius
+
+        if (observation_radius is None):
+            # How many lanes each part of the state has room for, and the obstacles that fill the
+            # lanes the road doesn't actually have.
+            self.num_encoded_lanes = num_lanes if (max_lanes is None) else max_lanes
+            self.padding_mask = ((1 << self.num_encoded_lanes) - 1) ^ ((1 << self.num_lanes) - 1)
+            self.num_car_lanes = self.num_encoded_lanes
+        else:
+            # A road section shifted left by observation_radius + 1 has the lane observation_radius
+            # to the left of the car at bit car_position - 1. The curb padding fills in the left curb
+            # and the lanes before it, and the right curb and the lanes after it.
+            self.num_encoded_lanes = (2 * observation_radius) + 1
+            curb_lanes = (1 << (observation_radius + 1)) - 1
+            self.curb_padding = curb_lanes | (curb_lanes << (num_lanes + observation_radius + 1))
+            self.window_mask = (1 << self.num_encoded_lanes) - 1
+            self.num_car_lanes = 0
+        # Whether the states mean the same thing on every road width.
+        self.width_independent = ((max_lanes is not None) or (observation_radius is not None))
+
+        self.state_size = self.num_car_lanes + (self.num_encoded_lanes * self.num_road_sections)
+        self.lane_shifts = numpy.arange(self.num_encoded_lanes, dtype=numpy.int64)
+
+        # Wide roads can see a lot of different road sections, so don't let the cache grow forever.
+        self.MAX_CACHED_ROAD_SECTIONS = 100000
+        self.road_section_encodings = {}
+
+        self.state = numpy.zeros(self.state_size, dtype=numpy.float32)
+
+
+    # Encodes a single state into the reused buffer, so the result is only good until the next call.
+    # Copy it if it needs to live longer than that.
+    def encode(self, car_position, road_sections):
+        state = self.state
+        offset = self.num_car_lanes
+        if (offset > 0):
+            state[:offset] = 0
+            state[car_position-1] = 1
+
+        for road_section in road_sections[:self.num_road_sections]:
+            state[offset:offset+self.num_encoded_lanes] = \
+                self.__road_section_encoding(self.__observed_road_section(car_position, road_section))
+            offset += self.num_encoded_lanes
+        # The road can be shorter than num_road_sections while the entrance scrolls by.
+        state[offset:] = 0
+
+        return state
+
+
+    # Encodes many states at once: car_positions has one entry per state and roads one row of road
+    # sections per state. The states are written into out if given, otherwise into a new array.
+    def encode_batch(self, car_positions, roads, out=None):
+        num_states = len(car_positions)
+        if (out is None):
+            out = numpy.empty((num_states, self.state_size), dtype=numpy.float32)
+        car_positions = numpy.asarray(car_positions, dtype=numpy.int64)
+        roads = numpy.asarray(roads, dtype=numpy.int64)[:, :self.num_road_sections]
+        if (self.observation_radius is None):
+            out[:, :self.num_car_lanes] = 0
+            out[numpy.arange(num_states), car_positions - 1] = 1
+            roads = roads | self.padding_mask
+        else:
+            roads = (((roads << (self.observation_radius + 1)) | self.curb_padding) \
+                >> car_positions[:, None]) & self.window_mask
+        out[:, self.num_car_lanes:] = ((roads[:, :, None] >> self.lane_shifts) & 1).reshape(num_states, -1)
+        return out
+
+
+    # Packs a state into a single integer, handy as a dictionary key. From the most significant bits
+    # down, it holds the car's lane (unless there's an observation_radius) followed by the road
+    # sections, one bit per encoded lane. Two states get the same integer exactly when they encode
+    # to the same list of 0s and 1s.
+    def pack(self, car_position, road_sections):
+        packed_state = (car_position - 1) if (self.observation_radius is None) else 0
+        num_road_sections = 0
+        for road_section in road_sections[:self.num_road_sections]:
+            packed_state = (packed_state << self.num_encoded_lanes) | \
+                self.__observed_road_section(car_position, road_section)
+            num_road_sections += 1
+        # Missing road sections while the entrance scrolls by are empty.
+        return packed_state << (self.num_encoded_lanes * (self.num_road_sections - num_road_sections))
+
+
+    # The part of the road section the car can see, as a bitmask of num_encoded_lanes bits.
+    def __observed_road_section(self, car_position, road_section):
+        if (self.observation_radius is None):
+            return road_section | self.padding_mask
+        return (((road_section << (self.observation_radius + 1)) | self.curb_padding) >> car_position) & self.window_mask
+
+
+    def __road_section_encoding(self, road_section):
+        road_section_encoding = self.road_section_encodings.get(road_section)
+        if (road_section_encoding is None):
+            road_section_encoding = ((road_section >> self.lane_shifts) & 1).astype(numpy.float32)
+            if (len(self.road_section_encodings) >= self.MAX_CACHED_ROAD_SECTIONS):
+                self.road_section_encodings.clear()
+            self.road_section_encodings[road_section] = road_section_encoding
+        return road_section_encoding
@@ -0,0 +1,50 @@
+import numpy
+
+
+"""A sum-tree: a binary tree where every leaf holds a priority and every parent holds the sum of
+its children, so the root holds the total. Finding the leaf where a running total crosses a given
+value and updating a leaf are both O(log n). The tree lives in one flat array, with the root at
+index 1 and the children of node i at 2i and 2i+1. Both operations take whole arrays of indices or
+values at once, walking the levels of the tree with array operations."""
+class SumTree:
+
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # Round the number of leaves up to a power of two so that every leaf is on the same level.
+        self.num_leaves = 1
+        while (self.num_leaves < capacity):
+            self.num_leaves *= 2
+        self.depth = self.num_leaves.bit_length() - 1
+        self.tree = numpy.zeros(2 * self.num_leaves, dtype=numpy.float64)
+
+
+    def total(self):
+        return self.tree[1]
+
+
+    def priorities(self, indices):
+        return self.tree[self.num_leaves + numpy.asarray(indices)]
+
+
+    def update(self, indices, priorities):
+        nodes = self.num_leaves + numpy.asarray(indices)
+        self.tree[nodes] = priorities
+        # Fix up the sums one level at a time, all the way to the root.
+        for level in range(self.depth):
+            nodes = numpy.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+
+    # For each value between 0 and total(), returns the index of the leaf where the running total
+    # of priorities crosses it. Leaves are found in proportion to their priority.
+    def find(self, values):
+        values = numpy.array(values, dtype=numpy.float64)
+        nodes = numpy.ones(len(values), dtype=numpy.int64)
+        for level in range(self.depth):
+            left_sums = self.tree[2 * nodes]
+            go_right = values >= left_sums
+            values -= left_sums * go_right
+            nodes = 2 * nodes + go_right
+        # Rounding can walk us into an empty leaf past the end. Keep within the real ones.
+        return numpy.minimum(nodes - self.num_leaves, self.capacity - 1)
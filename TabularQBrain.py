@@ -1,11 +1,14 @@
 import random
+import time
+from StateEncoder import StateEncoder
 
 
 class QValueBrain:
 
 
     def __init__(self, safe_reward, crash_reward, advances_learning_interval, base_discount, \
-        num_actions, step_size, random_move_probability, num_road_sections_in_q_values):
+        num_actions, step_size, random_move_probability, num_road_sections_in_q_values, max_lanes=None, \
+        observation_radius=None):
         self.MOVE_LEFT_ACTION = -1
         self.STAY_STILL_ACTION = 0
         self.MOVE_RIGHT_ACTION = 1
@@ -18,14 +21,36 @@ class QValueBrain:
         self.step_size = step_size
         self.random_move_probability = random_move_probability
         self.num_road_sections_in_q_values = num_road_sections_in_q_values
+        # Optional. If given, states are laid out for a road of max_lanes lanes whatever the
+        # actual road width, and what the brain learns carries over from one width to the next.
+        self.max_lanes = max_lanes
+        # Optional. If given, the brain only sees the observation_radius lanes on either side of the
+        # car, so the states are the same small size however wide the road is. Overrides max_lanes.
+        self.observation_radius = observation_radius
+
+        self.qvalues = None
+        # The states learned from since the last call to get_policy() or get_policy_changes(), or
+        # None before the first.
+        self.changed_state_keys = None
+
+        self.num_learning_steps = 0
 
         self.DEBUG_MESSAGES = False
 
 
     def on_series(self, num_lanes):
         self.num_lanes = num_lanes
-        self.latest_qvalues = {}
-        self.max_qvalues = {}
+        self.state_encoder = StateEncoder(self.num_lanes, self.num_road_sections_in_q_values, \
+            self.max_lanes, self.observation_radius)
+        # The q-table. The key is the state packed into a single integer. The value holds the
+        # latest q-values for moving left, staying still and moving right, followed by the max
+        # q-values for the same three actions. An action that has never been tried from the state
+        # has None for both.
+        #
+        # With max_lanes or an observation_radius, the packed states mean the same thing on every
+        # road, so keep what we learned on the narrower roads.
+        if ((not self.state_encoder.width_independent) or (self.qvalues is None)):
+            self.qvalues = {}
 
 
     def on_before_move(self, car_position, current_road_section, road):
@@ -53,10 +78,11 @@ class QValueBrain:
             # In the much more likely case that the agent is using its past learning to determine
             # the next move, determine the q-value to decide how to move. Essentially, take a
             # snapshot of the state -- where the car is and where the boulders are, and retrieve
-            # the q-values for moving left, staying still or moving right.
-            left = self.__state_action_to_qvalue(self.MOVE_LEFT_ACTION, car_position, road)
-            stay = self.__state_action_to_qvalue(self.STAY_STILL_ACTION, car_position, road)
-            right = self.__state_action_to_qvalue(self.MOVE_RIGHT_ACTION, car_position, road)
+            # the q-values for moving left, staying still or moving right. One lookup gets all three.
+            state_qvalues = self.qvalues.get(self.state_encoder.pack(car_position, road))
+            left = self.__state_action_to_qvalue(self.MOVE_LEFT_ACTION, state_qvalues)
+            stay = self.__state_action_to_qvalue(self.STAY_STILL_ACTION, state_qvalues)
+            right = self.__state_action_to_qvalue(self.MOVE_RIGHT_ACTION, state_qvalues)
 
             if (self.DEBUG_MESSAGES):
                 print('l: {0}, s: {1}, r: {2}, car_position: {3}, road: {4}'.format(left, stay, right, car_position, road))
@@ -84,51 +110,110 @@ class QValueBrain:
             if (self.DEBUG_MESSAGES):
                 print('action: {0}, crashed: {1}, na: {2}, reward: {3}, recent_road_states: {4}'.format(action, crashed, num_advances, reward, recent_road_states))
 
-            # The main purpose of this method: Learn.
-            self.__update_qvalues(action, reward, recent_road_states)
+            # The main purpose of this method: Learn. We don't necessarily learn from all the
+            # states. Grab the latest x states. The game hands us views into its trajectory buffer;
+            # convert the few rows we need to plain Python values.
+            self.num_learning_steps += 1
+            (learning_roads, learning_car_positions, learning_actions) = recent_road_states.window(self.advances_learning_interval)
+            self.__update_qvalues(reward, learning_roads.tolist(), learning_car_positions.tolist(), learning_actions.tolist())
     
 
-    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances):
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        # In headless mode the game keeps track of progress itself. Never print or sleep.
+        if (headless):
+            return
         if ((not fast_mode) or (game_number % display_frequency == 0)):
             print("Crashed! Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.".format(road_width, game_number, num_advances, max_advances))
             time.sleep(1)
 
 
-    def __update_qvalues(self, action, reward, recent_road_states):
-        # We don't necessarily learn from all the states. Grab the latest x states.
-        learning_states = recent_road_states[-self.advances_learning_interval:]
+    # What the brain plays by -- the q-table itself, not a copy, so pickle it (or copy it) before
+    # the brain learns any more. It can then be handed over to a copy of the brain that only plays.
+    def get_policy(self):
+        self.changed_state_keys = set()
+        return self.qvalues
+
+
+    # The road widths the policy from get_policy() can be played on, or None for any of them. Without
+    # max_lanes or an observation_radius, the policy only fits the road width it was learned on.
+    def get_policy_road_widths(self):
+        return None if (self.state_encoder.width_independent) else [self.num_lanes + 2]
+
+
+    # Plays by the given policy from get_policy() from now on.
+    def set_policy(self, policy):
+        self.qvalues = policy
+
+
+    # What changed in the q-table since the last call to get_policy() or get_policy_changes(): the
+    # q-values of every state learned from since, keyed like the q-table. A copy of the brain that
+    # plays by the earlier policy catches up with apply_policy_changes(), without the whole q-table
+    # having to be handed over again.
+    def get_policy_changes(self):
+        changes = {state_key: list(self.qvalues[state_key]) for state_key in self.changed_state_keys}
+        self.changed_state_keys = set()
+        return changes
+
+
+    def apply_policy_changes(self, changes):
+        self.qvalues.update(changes)
+
+
+    # Learns from a batch of learning steps, such as ActorBrain.take_steps() hands out, exactly as if
+    # on_after_move() had learned from them one at a time. The windows of all the steps are stacked
+    # one after the other into roads, car_positions and actions, and window_lengths says how many
+    # rows belong to each step.
+    def learn_steps(self, roads, car_positions, actions, window_lengths, step_actions, step_crashed, step_num_advances):
+        self.num_learning_steps += len(window_lengths)
+        (roads, car_positions, actions) = (roads.tolist(), car_positions.tolist(), actions.tolist())
+        start = 0
+        for (window_length, crashed) in zip(window_lengths.tolist(), step_crashed.tolist()):
+            reward = self.crash_reward if (crashed) else self.safe_reward
+            end = start + window_length
+            self.__update_qvalues(reward, roads[start:end], car_positions[start:end], actions[start:end])
+            start = end
+
+
+    # How the learning is going, for telemetry.
+    def get_stats(self):
+        return {'learning_steps': self.num_learning_steps, 'q_table_size': len(self.qvalues)}
+
+
+    def __update_qvalues(self, reward, learning_roads, learning_car_positions, learning_actions):
+        learning_states = zip(learning_roads, learning_car_positions, learning_actions)
 
         # Discount the earlier frames less than the more recent ones.
-        discount_power = len(learning_states)
-        for current_state in learning_states:
+        discount_power = len(learning_actions)
+        for (road_sections, car_position, action) in learning_states:
             # Calculates the discount for this frame. You'll note the earlier frames are discounted
             # less than the more recent ones.
             discount = self.base_discount ** discount_power
 
-            # Grab the relevant pieces from the state.
-            road_sections = current_state[0]
-            car_position = current_state[1]
-            action = current_state[2]
-
-            # Create our "key".
-            qvalues_tuple = self.__state_action_to_qvalues_tuple(action, car_position, road_sections)
-            if (qvalues_tuple in self.latest_qvalues):
-                if (qvalues_tuple not in self.max_qvalues):
-                    print('Sanity error.')
-
+            # Create our "key" and find the q-values for the state.
+            state_key = self.state_encoder.pack(car_position, road_sections)
+            state_qvalues = self.qvalues.get(state_key)
+            if (state_qvalues is None):
+                state_qvalues = [None] * (2 * self.num_actions)
+                self.qvalues[state_key] = state_qvalues
+            if (self.changed_state_keys is not None):
+                self.changed_state_keys.add(state_key)
+            latest_index = action - self.MOVE_LEFT_ACTION
+            max_index = latest_index + self.num_actions
+
+            if (state_qvalues[latest_index] is not None):
                 # Bellman's equation is at the heart of reinforcement learning. It's nice to
                 # understand Bellman's equation to some extent, but frankly we can just look at it
                 # as magic. Magic that works.
-                qvalue = self.__bellmans_equation(self.latest_qvalues[qvalues_tuple], reward, \
-                    discount, self.max_qvalues[qvalues_tuple])
+                qvalue = self.__bellmans_equation(state_qvalues[latest_index], reward, \
+                    discount, state_qvalues[max_index])
                 
                 # To learn, we must keep track of the latest q-value and the max q-value. Overwrite
                 # the latest, since this is the new latest.
-                self.latest_qvalues[qvalues_tuple] = qvalue
+                state_qvalues[latest_index] = qvalue
 
                 # And reset the max q-value if indeed the new value is larger.
-                if (qvalue > self.max_qvalues[qvalues_tuple]):
-                    self.max_qvalues[qvalues_tuple] = qvalue
+                if (qvalue > state_qvalues[max_index]):
+                    state_qvalues[max_index] = qvalue
             else:
                 # We fall into this else clause if we hit some new road condition not encountered
                 # before.
@@ -138,11 +223,11 @@ class QValueBrain:
                 qvalue = self.__bellmans_equation(0, reward, discount, 0)
 
                 # Set the latest and max.
-                self.latest_qvalues[qvalues_tuple] = qvalue
-                self.max_qvalues[qvalues_tuple] = qvalue
+                state_qvalues[latest_index] = qvalue
+                state_qvalues[max_index] = qvalue
 
             if (self.DEBUG_MESSAGES):
-                print('current_state: {0}, qvalue: {1}'.format(current_state, qvalue))
+                print('road_sections: {0}, car_position: {1}, action: {2}, qvalue: {3}'.format(road_sections, car_position, action, qvalue))
             # Decreasing the power will actually increase the discount in the next iteration. For
             # example, .9 squared is less than .9 because .81 is less than .9.
             discount_power -= 1
@@ -162,60 +247,13 @@ class QValueBrain:
         return result
 
 
-    # Given what the agent has learned, this returns the ranking of a given state and action.
-    def __state_action_to_qvalue(self, action, car_position, road_sections):
+    # Given what the agent has learned, this returns the ranking of a given action from a state
+    # whose q-values have already been looked up. A state or action never seen before ranks 0.
+    def __state_action_to_qvalue(self, action, state_qvalues):
         qvalue = 0
-        qvalues_tuple = self.__state_action_to_qvalues_tuple(action, car_position, road_sections)
-        if (qvalues_tuple in self.latest_qvalues):
-            if (qvalues_tuple not in self.max_qvalues):
-                print('Sanity error.')
-            qvalue = self.__bellmans_equation(self.latest_qvalues[qvalues_tuple], 0, self.base_discount, self.max_qvalues[qvalues_tuple])
+        if (state_qvalues is not None):
+            latest_index = action - self.MOVE_LEFT_ACTION
+            if (state_qvalues[latest_index] is not None):
+                qvalue = self.__bellmans_equation(state_qvalues[latest_index], 0, self.base_discount, \
+                    state_qvalues[latest_index + self.num_actions])
         return qvalue
-
-
-    # The states are stored in a map, or otherwise referenced by a key. This returns that key for
-    # any given state and action.
-    def __state_action_to_qvalues_tuple(self, action, car_position, road_sections):
-        # We start with a list and convert it to a tuple later. What information needs to be
-        # stored? The car position, the road and any obstacles, as well as the action (moving left,
-        # moving right or staying still).
-        #
-        # This information is stored in a binary manner, for reasons that will become clear later.
-        # Here's how the structure looks:
-        # |n|n|n  |n|n|n |n|n|n |n|n|n  |n|n|n
-        #  car          roadway         action
-        #
-        # If the car is on the left side of the road, the left-most number will be 1. In the
-        # middle, the second number will be 1 and on the right side of the road, the third will be
-        # set. The numbers for the roadway will be all 0s for a roadway with no obstacles. If there
-        # is 1 obstacle, then a 1 will be set describing its position. Finally, a move to the left
-        # will set the number third from the right, staying still will set the number second from
-        # the right and a move to the right will set the last number.
-        #
-        # For example, a car on the right of the road that comes across a boulder similarly on the
-        # road but two spots away, and consequently moving left will have a state like this:
-        #
-        # |0|0|1  |0|0|0 |0|0|0 |0|0|1  |1|0|0
-        #
-        # Create the list with the appropriate number of values and fill it will all 0s.
-        qvalues_list = [0] * (self.num_lanes + (self.num_lanes * self.num_road_sections_in_q_values) + self.num_actions)
-
-        # Put a 1 in the place representing the car's position.
-        qvalues_list[car_position-1] = 1
-
-        # Look for obstacles and put a 1 in the appropriate spots if we find them.
-        for road_section_index, road_section in enumerate(road_sections):
-            for road_obstacle_it in range(1,len(road_section)-1):
-                if (road_section[road_obstacle_it] != ' '):
-                    qvalues_list[self.num_lanes+(self.num_lanes*road_section_index)+road_obstacle_it-1] = 1
-                else:
-                    qvalues_list[self.num_lanes+(self.num_lanes*road_section_index)+road_obstacle_it-1] = 0
-
-        # Put a 1 in the last three numbers of the list representing the direction the car is
-        # moving.
-        qvalues_list[action - 2] = 1
-
-        # Convert the list to a tuple so that Python will generate a hash for us.
-        qvalues_tuple = tuple(qvalues_list)
-
-        return qvalues_tuple
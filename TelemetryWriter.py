@@ -0,0 +1,110 @@
+import json
+import queue
+import threading
+import time
+
+
+"""Writes telemetry records -- plain dictionaries -- to a file, one JSON object per line. write()
+only puts the record on a queue and returns straight away; a background thread takes the records
+off the queue in batches, turns them into JSON and writes each batch in one go. The file is flushed
+at most every flush_interval seconds, so a dashboard tailing the file is never far behind, yet
+logging never holds up the game.
+
+A record that can't be turned into JSON is left out, and the first such error is raised by close().
+Should the thread die, say because the disk is full, close() still writes whatever is left, closes
+the file whatever happens, and then raises what killed the thread."""
+class TelemetryWriter:
+
+
+    def __init__(self, path, max_batch_size=1000, flush_interval=1.0):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.telemetry_file = open(path, 'a')
+        self.records = queue.SimpleQueue()
+        # Whatever stopped the background thread, or the first record that couldn't be written.
+        self.error = None
+        self.thread = threading.Thread(target=self.__write_records, name='TelemetryWriter', daemon=True)
+        self.thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+    # The record mustn't be changed afterwards, since it is written out later, on another thread.
+    def write(self, record):
+        self.records.put(record)
+
+
+    # Writes whatever is still waiting and closes the file.
+    def close(self):
+        try:
+            if (self.thread.is_alive()):
+                self.records.put(None)
+                self.thread.join()
+        finally:
+            if (not self.telemetry_file.closed):
+                try:
+                    self.__write_leftover_records()
+                finally:
+                    self.telemetry_file.close()
+        (error, self.error) = (self.error, None)
+        if (error is not None):
+            raise error
+
+
+    def __write_records(self):
+        try:
+            self.__write_batches()
+        except BaseException as error:
+            self.error = error
+            raise
+
+
+    def __write_batches(self):
+        last_flush_time = time.monotonic()
+        closing = False
+        while (not closing):
+            try:
+                batch = [self.records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while ((len(batch) < self.max_batch_size) and (not self.records.empty())):
+                batch.append(self.records.get())
+
+            if ((len(batch) > 0) and (batch[-1] is None)):
+                # Nothing is written after close(), so None can only be the last record.
+                batch.pop()
+                closing = True
+            if (len(batch) > 0):
+                self.telemetry_file.write(self.__lines(batch))
+            if (closing or (time.monotonic() - last_flush_time >= self.flush_interval)):
+                self.telemetry_file.flush()
+                last_flush_time = time.monotonic()
+
+
+    # Only has anything to do if the thread died: the records it never got to are still on the
+    # queue.
+    def __write_leftover_records(self):
+        leftover_records = []
+        while (not self.records.empty()):
+            record = self.records.get()
+            if (record is not None):
+                leftover_records.append(record)
+        self.telemetry_file.write(self.__lines(leftover_records))
+
+
+    def __lines(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record) + '\n')
+            except (TypeError, ValueError) as error:
+                if (self.error is None):
+                    self.error = error
+        return ''.join(lines)
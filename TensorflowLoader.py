@@ -0,0 +1,11 @@
+"""Tensorflow takes seconds and hundreds of megabytes to load, so the brains that use it only
+import it, through import_tensorflow(), once they are actually used. The other brains, and the
+processes that only play, never load it at all."""
+
+
+def import_tensorflow():
+    try:
+        import tensorflow
+    except ImportError as error:
+        raise ImportError('This brain needs tensorflow 1.x, which could not be imported: {0}'.format(error)) from error
+    return tensorflow
@@ -0,0 +1,140 @@
+import sys
+import threading
+
+
+"""Draws the game on its own thread, a fixed number of times a second, without ever holding up the
+game. The game hands over the latest state with update(), which only copies it into buffers made
+up front; the drawing thread wakes up every 1/frames_per_second seconds, takes a snapshot of
+whatever the latest state is by then and draws that. Any states in between are simply never drawn,
+so the game runs just as fast whether anyone is watching or not.
+
+Each frame is put together into one string and written in one go, drawing over the previous frame
+in place with ANSI escape codes rather than scrolling the screen with blank lines."""
+class TerminalRenderer:
+
+
+    CURSOR_HOME = '\x1b[H'
+    CLEAR_SCREEN = '\x1b[2J'
+    CLEAR_TO_END_OF_LINE = '\x1b[K'
+    CLEAR_TO_END_OF_SCREEN = '\x1b[J'
+    HIDE_CURSOR = '\x1b[?25l'
+    SHOW_CURSOR = '\x1b[?25h'
+
+
+    def __init__(self, frames_per_second=30, num_previous_road_sections=3, output=None):
+        self.frames_per_second = frames_per_second
+        self.num_previous_road_sections = num_previous_road_sections
+        self.output = sys.stdout if (output is None) else output
+        # The latest state. update() writes it in place and the drawing thread copies it out, both
+        # holding the lock. version goes up by one with every update.
+        self.lock = threading.Lock()
+        self.version = 0
+        self.road_width = None
+        self.game_number = None
+        self.num_advances = None
+        self.max_advances = None
+        self.car_position = None
+        self.crashed = False
+        self.road = []
+        # The road sections the car has already driven over, in a circle: the oldest is at
+        # next_previous_road_section once there are num_previous_road_sections of them.
+        self.previous_road_sections = [0] * num_previous_road_sections
+        self.num_previous_road_sections_driven = 0
+        self.next_previous_road_section = 0
+        self.current_road_section = None
+        self.num_frames_drawn = 0
+        self.thread = None
+
+
+    def start(self):
+        self.stop_event = threading.Event()
+        self.output.write(self.HIDE_CURSOR + self.CLEAR_SCREEN)
+        self.thread = threading.Thread(target=self.__draw_frames, name='TerminalRenderer', daemon=True)
+        self.thread.start()
+
+
+    # Draws the last state one more time and gives the terminal back.
+    def stop(self):
+        if (self.thread is not None):
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.output.write(self.SHOW_CURSOR)
+            self.output.flush()
+
+
+    # Called by the game at the start of every game, with num_advances 0, and after every move. The
+    # road is copied, since the game keeps changing it, but nothing is drawn here.
+    def update(self, road_width, game_number, num_advances, max_advances, car_position, crashed, road):
+        with self.lock:
+            if (num_advances == 0):
+                # A new game. The car hasn't driven over anything yet.
+                self.num_previous_road_sections_driven = 0
+                self.current_road_section = None
+            else:
+                # The road has moved on by one road section since the last move, if there was one.
+                if ((self.current_road_section is not None) and (self.num_previous_road_sections > 0)):
+                    self.previous_road_sections[self.next_previous_road_section] = self.current_road_section
+                    self.next_previous_road_section = (self.next_previous_road_section + 1) % self.num_previous_road_sections
+                    self.num_previous_road_sections_driven = min(self.num_previous_road_sections_driven + 1, \
+                        self.num_previous_road_sections)
+                self.current_road_section = road[0]
+            self.road_width = road_width
+            self.game_number = game_number
+            self.num_advances = num_advances
+            self.max_advances = max_advances
+            self.car_position = car_position
+            self.crashed = crashed
+            self.road[:] = road
+            self.version += 1
+
+
+    # A copy of the latest state, the road sections driven over oldest first, and its version.
+    def __snapshot(self):
+        with self.lock:
+            num_driven = self.num_previous_road_sections_driven
+            oldest = (self.next_previous_road_section - num_driven) % max(self.num_previous_road_sections, 1)
+            previous_road_sections = [self.previous_road_sections[(oldest + index) % self.num_previous_road_sections] \
+                for index in range(num_driven)]
+            state = (self.road_width, self.game_number, self.num_advances, self.max_advances, self.car_position, \
+                self.crashed, tuple(self.road), previous_road_sections)
+            return (state, self.version)
+
+
+    def __draw_frames(self):
+        drawn_version = 0
+        stopping = False
+        while (not stopping):
+            stopping = self.stop_event.wait(1 / self.frames_per_second)
+            # Nothing new since the last frame means nothing to draw.
+            if (self.version == drawn_version):
+                continue
+            (state, drawn_version) = self.__snapshot()
+            self.output.write(self.__frame(state))
+            self.output.flush()
+            self.num_frames_drawn += 1
+
+
+    def __frame(self, state):
+        (road_width, game_number, num_advances, max_advances, car_position, crashed, road, previous_road_sections) = state
+        lines = ['Road width: {0}, game num: {1}, num advances: {2}, max advances: {3}.'.format(road_width, \
+            game_number, num_advances, max_advances), '']
+        for road_section in previous_road_sections:
+            lines.append(self.__road_section_to_string(road_section, road_width))
+        # Draw the burning embers of the crashed car, engulfed in roiling clouds of burning
+        # gasoline. Or an X. Same thing.
+        lines.append(self.__road_section_to_string(road[0], road_width, car_position, 'X' if crashed else 'H'))
+        for road_section in road[1:]:
+            lines.append(self.__road_section_to_string(road_section, road_width))
+        return self.CURSOR_HOME + ''.join(line + self.CLEAR_TO_END_OF_LINE + '\n' for line in lines) \
+            + self.CLEAR_TO_END_OF_SCREEN
+
+
+    def __road_section_to_string(self, road_section, road_width, car_position=None, car_character=None):
+        characters = ['|'] * road_width
+        for lane in range(road_width - 2):
+            characters[lane + 1] = 'O' if ((road_section >> lane) & 1) else ' '
+        if (car_position is not None):
+            characters[car_position] = car_character
+        left_margin = ' ' * ((80 - road_width) // 2)
+        return left_margin + ''.join(characters)
@@ -0,0 +1,50 @@
+import numpy
+
+
+"""This class keeps the last several game states -- the road, the car position and the action
+taken -- in preallocated arrays, so that recording a move never allocates anything. Every state is
+written twice, once in each half of the arrays, which means the most recent states are always
+sitting next to each other and can be handed out as views rather than copies."""
+class TrajectoryBuffer:
+
+
+    def __init__(self, capacity, num_road_sections):
+        self.capacity = capacity
+        self.num_road_sections = num_road_sections
+        self.roads = numpy.zeros((2 * capacity, num_road_sections), dtype=numpy.int64)
+        self.car_positions = numpy.zeros(2 * capacity, dtype=numpy.int64)
+        self.actions = numpy.zeros(2 * capacity, dtype=numpy.int64)
+        self.clear()
+
+
+    def __len__(self):
+        return self.size
+
+
+    def clear(self):
+        self.size = 0
+        self.position = 0
+
+
+    def append(self, road, car_position, action):
+        # The road may be shorter than num_road_sections while the entrance scrolls by. Pad it with
+        # empty road sections, which is how the brains would encode the missing rows anyway.
+        num_road_sections = len(road)
+        for index in (self.position, self.position + self.capacity):
+            self.roads[index, :num_road_sections] = road
+            self.roads[index, num_road_sections:] = 0
+            self.car_positions[index] = car_position
+            self.actions[index] = action
+        self.position = (self.position + 1) % self.capacity
+        if (self.size < self.capacity):
+            self.size += 1
+
+
+    # Returns (roads, car_positions, actions) for the latest num_states states, oldest first. These
+    # are views into the buffer, so they are only good until the next append. Copy them if they
+    # need to live longer than that.
+    def window(self, num_states):
+        num_states = min(num_states, self.size)
+        end = self.position + self.capacity
+        start = end - num_states
+        return (self.roads[start:end], self.car_positions[start:end], self.actions[start:end])
@@ -0,0 +1,62 @@
+import numpy
+from TrajectoryRecorder import TrajectoryRecorder
+
+
+"""Reads back a file written by TrajectoryRecorder. The file is memory-mapped rather than read in,
+so even a recording of millions of moves opens instantly, and only the parts actually used are
+ever loaded. The columns -- roads, road_widths, car_positions, actions and crashed -- are arrays
+over every move in the file, oldest first, and batches() hands them out a batch at a time.
+
+A game is every move up to and including the next one that crashed. Moves that were still being
+written when the reader was opened are not seen; open another reader to pick them up."""
+class TrajectoryReader:
+
+
+    def __init__(self, path):
+        self.path = path
+        header = TrajectoryRecorder.read_header(path)
+        self.num_road_sections = int(header['num_road_sections'])
+        record_dtype = TrajectoryRecorder.record_dtype(self.num_road_sections)
+        header_size = TrajectoryRecorder.HEADER_DTYPE.itemsize
+        # numpy can't map an empty file, and a record cut off in the middle is left out.
+        with open(path, 'rb') as trajectory_file:
+            num_records = (trajectory_file.seek(0, 2) - header_size) // record_dtype.itemsize
+        if (num_records > 0):
+            self.records = numpy.memmap(path, dtype=record_dtype, mode='r', offset=header_size, shape=(num_records,))
+        else:
+            self.records = numpy.zeros(0, dtype=record_dtype)
+
+        self.roads = self.records['road']
+        self.road_widths = self.records['road_width']
+        self.car_positions = self.records['car_position']
+        self.actions = self.records['action']
+        self.crashed = self.records['crashed']
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    # Returns the indices of the moves on the given road width, or of all of them if None.
+    def indices(self, road_width=None):
+        if (road_width is None):
+            return numpy.arange(len(self.records))
+        return numpy.flatnonzero(self.road_widths == road_width)
+
+
+    # Yields (roads, road_widths, car_positions, actions, crashed) for batch_size moves at a time,
+    # the last batch holding whatever is left over. In order, the batches are views into the file;
+    # shuffled, they are copies. Passing a road width only yields the moves on that road width.
+    def batches(self, batch_size, road_width=None, shuffle=False, seed=None):
+        if ((road_width is None) and (not shuffle)):
+            for start in range(0, len(self.records), batch_size):
+                batch = self.records[start:start + batch_size]
+                yield (batch['road'], batch['road_width'], batch['car_position'], batch['action'], batch['crashed'])
+            return
+
+        indices = self.indices(road_width)
+        if (shuffle):
+            numpy.random.default_rng(seed).shuffle(indices)
+        for start in range(0, len(indices), batch_size):
+            batch = self.records[indices[start:start + batch_size]]
+            yield (batch['road'], batch['road_width'], batch['car_position'], batch['action'], batch['crashed'])
@@ -0,0 +1,112 @@
+import os
+import numpy
+
+
+"""Records every move of every game to a compact binary file, so that the games can be replayed --
+with TrajectoryReader -- long after the run is over, without making the roads all over again.
+
+Each move is one fixed-size record: the road the car saw (num_road_sections road sections, each one
+a bitmask of its obstacles, as in GameStructure), the road width, where the car was, the action it
+took and whether that crashed it. The file starts with a short header and the records follow one
+after the other, so the file can only ever be appended to. Records are collected in a preallocated
+chunk and written a whole chunk at a time, so recording a move costs next to nothing.
+
+Opening a file that already exists carries on where it left off. If the last run died in the middle
+of writing a record, that record is cut off first."""
+class TrajectoryRecorder:
+
+
+    MAGIC = b'SLAMTRAJ'
+    VERSION = 1
+    HEADER_DTYPE = numpy.dtype([('magic', 'S8'), ('version', '<u4'), ('num_road_sections', '<u4')])
+    # A road section is kept in 32 bits, so there can be no more than 32 lanes.
+    MAX_LANES = 32
+
+
+    def __init__(self, path, num_road_sections, chunk_size=65536):
+        self.path = path
+        self.num_road_sections = num_road_sections
+        self.chunk_size = chunk_size
+        self.record_dtype = TrajectoryRecorder.record_dtype(num_road_sections)
+        self.num_records = 0
+
+        if (os.path.exists(path) and (os.path.getsize(path) > 0)):
+            header = TrajectoryRecorder.read_header(path)
+            if (header['num_road_sections'] != num_road_sections):
+                raise ValueError('{0} has {1} road sections per move, not {2}.'.format(path, \
+                    header['num_road_sections'], num_road_sections))
+            self.trajectory_file = open(path, 'r+b')
+            num_records = (os.path.getsize(path) - self.HEADER_DTYPE.itemsize) // self.record_dtype.itemsize
+            self.trajectory_file.truncate(self.HEADER_DTYPE.itemsize + num_records * self.record_dtype.itemsize)
+            self.trajectory_file.seek(0, os.SEEK_END)
+        else:
+            self.trajectory_file = open(path, 'wb')
+            header = numpy.array((self.MAGIC, self.VERSION, num_road_sections), dtype=self.HEADER_DTYPE)
+            self.trajectory_file.write(header.tobytes())
+
+        self.chunk = numpy.zeros(chunk_size, dtype=self.record_dtype)
+        # The columns of the chunk, looked up once rather than on every move.
+        self.roads = self.chunk['road']
+        self.road_widths = self.chunk['road_width']
+        self.car_positions = self.chunk['car_position']
+        self.actions = self.chunk['action']
+        self.crashed = self.chunk['crashed']
+        self.chunk_position = 0
+
+
+    @staticmethod
+    def record_dtype(num_road_sections):
+        return numpy.dtype([('road', '<u4', (num_road_sections,)), ('road_width', 'u1'), ('car_position', 'u1'), \
+            ('action', 'i1'), ('crashed', '?')])
+
+
+    @staticmethod
+    def read_header(path):
+        header = numpy.fromfile(path, dtype=TrajectoryRecorder.HEADER_DTYPE, count=1)
+        if ((len(header) == 0) or (header[0]['magic'] != TrajectoryRecorder.MAGIC)):
+            raise ValueError('{0} is not a trajectory file.'.format(path))
+        if (header[0]['version'] != TrajectoryRecorder.VERSION):
+            raise ValueError('{0} is version {1} of the trajectory file format, not version {2}.'.format(path, \
+                header[0]['version'], TrajectoryRecorder.VERSION))
+        return header[0]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+    # car_position is where the car was before it took action. The road may be shorter than
+    # num_road_sections while the entrance scrolls by; it is padded with empty road sections.
+    def record(self, road_width, road, car_position, action, crashed):
+        if (road_width - 2 > self.MAX_LANES):
+            raise ValueError('Only roads of up to {0} lanes can be recorded.'.format(self.MAX_LANES))
+        position = self.chunk_position
+        num_road_sections = min(len(road), self.num_road_sections)
+        self.roads[position, :num_road_sections] = road[:num_road_sections]
+        self.roads[position, num_road_sections:] = 0
+        self.road_widths[position] = road_width
+        self.car_positions[position] = car_position
+        self.actions[position] = action
+        self.crashed[position] = crashed
+        self.chunk_position += 1
+        self.num_records += 1
+        if (self.chunk_position == self.chunk_size):
+            self.flush()
+
+
+    # Writes out the moves recorded so far.
+    def flush(self):
+        if (self.chunk_position > 0):
+            self.trajectory_file.write(self.chunk[:self.chunk_position].tobytes())
+            self.chunk_position = 0
+        self.trajectory_file.flush()
+
+
+    def close(self):
+        if (not self.trajectory_file.closed):
+            self.flush()
+            self.trajectory_file.close()
@@ -0,0 +1,104 @@
+import numpy
+from RoadTape import RoadTape
+
+
+"""This class plays many games at once, in lockstep. Where GameStructure moves one car down one
+road a Python call at a time, this class keeps every road in one array and every car position in
+another, and moves all of them with a handful of array operations. There is no drawing and no
+learning logic in here.
+
+The roads are the same as GameStructure's: every road section is an integer bitmask of its
+obstacles, with the curbs implied, and the rows are made by RoadTape.make_rows(), by the same
+rules. car_road_states() hands the states to a brain's StateEncoder, so they are exactly what the
+brain would see in a GameStructure game."""
+class VectorGameStructure:
+
+
+    def __init__(self, num_games, road_width, random_obstacle_probability, \
+            max_number_display_road_states, seed=None):
+        self.num_games = num_games
+        self.road_width = road_width
+        self.num_lanes = road_width - 2
+        self.random_obstacle_probability = random_obstacle_probability
+        self.max_number_display_road_states = max_number_display_road_states
+        self.random_generator = numpy.random.default_rng(seed)
+
+        # Handy for picking out one cell per game, e.g. road_sections[game_indices, num_open - 1].
+        self.game_indices = numpy.arange(self.num_games)
+        self.lane_shifts = numpy.arange(self.num_lanes, dtype=numpy.int64)
+
+        # Start with the car in the middle of the road (or close to it), just like GameStructure.
+        self.starting_car_position = ((self.road_width - 2) // 2) + 1
+
+        self.reset()
+
+
+    def reset(self):
+        # The road for every game, one road section per row. Row 0 is the one the car is on, the
+        # last row is the one that was most recently created.
+        self.road = numpy.zeros((self.num_games, self.max_number_display_road_states), dtype=numpy.int64)
+
+        self.car_positions = numpy.full(self.num_games, self.starting_car_position, dtype=numpy.int64)
+        self.num_advances = numpy.zeros(self.num_games, dtype=numpy.int64)
+        self.max_advances = 0
+        self.game_numbers = numpy.zeros(self.num_games, dtype=numpy.int64)
+        self.previous_road_section_num_obstacles = numpy.zeros(self.num_games, dtype=numpy.int64)
+
+        # GameStructure starts every game with an empty entrance and then creates a new row before
+        # the first move. Every row but the last is already empty, so only create the last.
+        self.__create_next_road_sections()
+
+
+    # The state every game is in, encoded by state_encoder (a brain's StateEncoder), one row per
+    # game.
+    def car_road_states(self, state_encoder, out=None):
+        return state_encoder.encode_batch(self.car_positions, self.road, out)
+
+
+    # Moves every car by its action (-1, 0 or 1) and scrolls every road by one row. Returns which
+    # games crashed on this step and how far each got. Crashed games are reset right away, so the
+    # caller can simply keep stepping.
+    def step(self, actions):
+        # Keep track of each advance, so that we know how well we are learning.
+        self.num_advances += 1
+
+        # Move the cars.
+        self.car_positions += actions
+
+        # Crashing involves hitting either the curb or a boulder.
+        on_road = (self.car_positions > 0) & (self.car_positions < self.road_width - 1)
+        boulders = (self.road[:, 0] >> numpy.clip(self.car_positions - 1, 0, self.num_lanes - 1)) & 1
+        crashed = (~on_road) | (boulders == 1)
+        advances = self.num_advances.copy()
+        self.max_advances = max(self.max_advances, int(advances.max()))
+
+        if (crashed.any()):
+            self.__reset_games(numpy.flatnonzero(crashed))
+
+        # Scroll the road up by one row, then create the new bottom row. Numpy copes with the
+        # source and destination overlapping.
+        self.road[:, :-1] = self.road[:, 1:]
+        self.__create_next_road_sections()
+
+        return (crashed, advances)
+
+
+    def __reset_games(self, game_indices):
+        # Clear the road back to an empty entrance. The next scroll drops row 0 and the next
+        # create fills in the last row, so the car starts on an empty row like GameStructure.
+        self.road[game_indices] = 0
+        self.car_positions[game_indices] = self.starting_car_position
+        self.num_advances[game_indices] = 0
+        self.previous_road_section_num_obstacles[game_indices] = 0
+        self.game_numbers[game_indices] += 1
+
+
+    def __create_next_road_sections(self):
+        # Every game gets the next row both ways, with one lane left open and with two, and then
+        # takes the one its previous row calls for, just like RoadTape.next_road_section().
+        road_sections = RoadTape.make_rows(self.random_generator, self.num_games, self.num_lanes, \
+            self.random_obstacle_probability)
+        next_road_sections = road_sections[self.game_indices, (self.previous_road_section_num_obstacles > 1).astype(numpy.int64)]
+
+        self.road[:, -1] = next_road_sections
+        self.previous_road_section_num_obstacles = ((next_road_sections[:, None] >> self.lane_shifts) & 1).sum(axis=1)
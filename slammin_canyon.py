@@ -1,7 +1,25 @@
+import functools
+import os
+import random
+import numpy
+from ActorLearner import ActorLearner
+from GameProfiler import GameProfiler
 from GameStructure import GameStructure
-from DeepQNeuralBrain import DeepQNeuralBrain
+from PolicyEvaluator import PolicyEvaluator
+from PrioritizedExperienceReplay import PrioritizedExperienceReplay
+from RoadTape import RoadTape
+from TelemetryWriter import TelemetryWriter
+from TerminalRenderer import TerminalRenderer
+from TrajectoryRecorder import TrajectoryRecorder
 
 
+# One of DeepQNeuralBrain, NumpyDeepQBrain, CrossEntropyNeuralBrain, CrossEntropyQBrain or
+# QValueBrain. Or OptimalPolicyBrain, which doesn't learn but works out the best possible moves up
+# front, as a yardstick for the others. It only works on narrow roads: no more than 24 lanes in all
+# across NUMBER_ROAD_SECTIONS_IN_Q_VALUES road sections, so at most 8 lanes (a road width of 10)
+# with 3 of them. Only the chosen brain's module is
+# imported, so the tensorflow brains don't slow down the others.
+BRAIN = 'DeepQNeuralBrain'
 STARTING_ROAD_WIDTH = 10
 ENDING_ROAD_WIDTH = 25
 NUM_ADVANCES_LEVEL_COMPLETE = 2000
@@ -11,6 +29,7 @@ MAX_NUMBER_DISPLAY_ROAD_STATES = 3
 MAX_NUMBER_ROAD_STATES = 6
 MAX_HISTORY = 50
 FAST_MODE = True
+HEADLESS = False
 SAFE_REWARD = 1
 CRASH_REWARD = -1
 ADVANCES_LEARNING_INTERVAL = 4
@@ -21,18 +40,178 @@ STEP_SIZE = 0.2
 DEEP_Q_TRAINING_INTERVAL = 1000
 RANDOM_MOVE_PROBABILITY = .001
 NUMBER_ROAD_SECTIONS_IN_Q_VALUES = 3
+# Carry what was learned on each road width over to the next, rather than starting from scratch.
+TRANSFER_LEARNING = True
+# If set, the brain only sees this many lanes on either side of the car, curbs included, so the
+# states stay the same size however wide the road gets. None shows the brain the whole road.
+OBSERVATION_RADIUS = None
+# With more than one actor, each actor plays its own games in a process of its own while this
+# process does the learning, sending the brain's policy back out every POLICY_BROADCAST_INTERVAL
+# learning steps. ROAD_TAPE_DIRECTORY, PROFILE, TELEMETRY_FILE, RENDERER_FRAMES_PER_SECOND and
+# TRAJECTORY_FILE only work with a single actor.
+NUM_ACTORS = 1
+POLICY_BROADCAST_INTERVAL = 1000
+# Seeds the random numbers, so that a run can be repeated. None picks a different run every time.
+SEED = None
+# If set, the roads for each road width are played off road_tape_<road width>.npy in this directory,
+# when there is one, and all the roads played are saved there afterwards. Another brain can then be
+# played on the very same roads.
+ROAD_TAPE_DIRECTORY = None
+# Times each phase of the game loop and prints where the time went at the end of every road width.
+PROFILE = False
+# If set, a JSON record is appended to this file after every game and every road width: the road
+# width, game number, advances, wall time and how the brain's learning is going.
+TELEMETRY_FILE = None
+# If set (and not HEADLESS), the game is drawn in place this many times a second by a thread of its
+# own, and plays at full speed. None scrolls the game down the screen as it plays, pausing to
+# let you watch.
+RENDERER_FRAMES_PER_SECOND = None
+# If set, every move of every game -- the road, the car position, the action and whether it
+# crashed -- is appended to this binary file, to be read back with TrajectoryReader.
+TRAJECTORY_FILE = None
+# If more than 0, the brain is frozen once training is over and plays this many games per road width,
+# each on its own seeded road and for at most EVALUATION_MAX_ADVANCES advances, spread over
+# EVALUATION_PROCESSES processes (None for every core). How far the car gets and what it crashes
+# into are printed for each road width.
+EVALUATION_GAMES = 0
+EVALUATION_MAX_ADVANCES = 2000
+EVALUATION_PROCESSES = None
+REPLAY_MEMORY_SIZE = 100000
+REPLAY_BATCH_SIZE = 64
+REPLAY_BATCHES = 16
+TRAINING_BATCH_SIZE = 100
+TRAINING_EPOCHS = 1
 
 
-def main():
-    game = GameStructure(STARTING_ROAD_WIDTH, ENDING_ROAD_WIDTH, NUM_ADVANCES_LEVEL_COMPLETE, \
+def create_brain(brain_name):
+    # The widest road is ENDING_ROAD_WIDTH-1 (range() stops short of the end), less two curbs.
+    max_lanes = None
+    if (TRANSFER_LEARNING):
+        max_lanes = ENDING_ROAD_WIDTH - 3
+
+    if (brain_name in ('DeepQNeuralBrain', 'NumpyDeepQBrain')):
+        if (brain_name == 'DeepQNeuralBrain'):
+            from DeepQNeuralBrain import DeepQNeuralBrain as DeepQBrain
+        else:
+            from NumpyDeepQBrain import NumpyDeepQBrain as DeepQBrain
+
+        experience_replay = PrioritizedExperienceReplay(REPLAY_MEMORY_SIZE, ADVANCES_LEARNING_INTERVAL, seed=SEED)
+
+        return DeepQBrain(SAFE_REWARD, CRASH_REWARD, ADVANCES_LEARNING_INTERVAL, DISCOUNT, \
+            GAMMA, NUMBER_ACTIONS, STEP_SIZE, DEEP_Q_TRAINING_INTERVAL, RANDOM_MOVE_PROBABILITY,
+            NUMBER_ROAD_SECTIONS_IN_Q_VALUES, experience_replay, REPLAY_BATCH_SIZE, REPLAY_BATCHES, \
+            TRAINING_BATCH_SIZE, TRAINING_EPOCHS, max_lanes, OBSERVATION_RADIUS)
+    elif (brain_name == 'CrossEntropyNeuralBrain'):
+        from CrossEntropyNeuralBrain import CrossEntropyNeuralBrain
+        return CrossEntropyNeuralBrain(SAFE_REWARD, CRASH_REWARD, ADVANCES_LEARNING_INTERVAL, DISCOUNT, \
+            NUMBER_ACTIONS, STEP_SIZE, RANDOM_MOVE_PROBABILITY, NUMBER_ROAD_SECTIONS_IN_Q_VALUES, max_lanes, \
+            OBSERVATION_RADIUS)
+    elif (brain_name == 'CrossEntropyQBrain'):
+        from CrossEntropyQBrain import CrossEntropyQBrain
+        return CrossEntropyQBrain(SAFE_REWARD, CRASH_REWARD, ADVANCES_LEARNING_INTERVAL, DISCOUNT, \
+            NUMBER_ACTIONS, STEP_SIZE, RANDOM_MOVE_PROBABILITY, NUMBER_ROAD_SECTIONS_IN_Q_VALUES, max_lanes, \
+            OBSERVATION_RADIUS)
+    elif (brain_name == 'QValueBrain'):
+        from TabularQBrain import QValueBrain
+        return QValueBrain(SAFE_REWARD, CRASH_REWARD, ADVANCES_LEARNING_INTERVAL, DISCOUNT, \
+            NUMBER_ACTIONS, STEP_SIZE, RANDOM_MOVE_PROBABILITY, NUMBER_ROAD_SECTIONS_IN_Q_VALUES, max_lanes, \
+            OBSERVATION_RADIUS)
+    elif (brain_name == 'OptimalPolicyBrain'):
+        from OptimalPolicyBrain import OptimalPolicyBrain
+        brain = OptimalPolicyBrain(RANDOM_OBSTACLE_PROBABILITY, NUMBER_ROAD_SECTIONS_IN_Q_VALUES)
+        # Rather than finding out after solving all the narrower roads.
+        if (ENDING_ROAD_WIDTH - 3 > brain.max_num_lanes()):
+            raise ValueError('OptimalPolicyBrain can only solve roads up to a width of {0} with {1} road sections, ' \
+                'but ENDING_ROAD_WIDTH plays roads up to a width of {2}.'.format(brain.max_num_lanes() + 2, \
+                NUMBER_ROAD_SECTIONS_IN_Q_VALUES, ENDING_ROAD_WIDTH - 1))
+        return brain
+    raise ValueError('Unknown brain: {0}'.format(brain_name))
+
+
+# The settings above, as they are right now, by name.
+def current_settings():
+    return {name: value for (name, value) in globals().items() if name.isupper()}
+
+
+# Makes a brain in a process of its own. A process started from scratch gets the settings as they
+# are in this file, so bring over any that were changed since.
+def create_brain_with_settings(brain_name, settings):
+    globals().update(settings)
+    return create_brain(brain_name)
+
+
+def create_game():
+    road_tapes = {}
+    if (ROAD_TAPE_DIRECTORY is not None):
+        for road_width in range(STARTING_ROAD_WIDTH, ENDING_ROAD_WIDTH):
+            road_tape_path = road_tape_file(road_width)
+            if (os.path.exists(road_tape_path)):
+                road_tapes[road_width] = RoadTape.load(road_tape_path, road_width - 2, RANDOM_OBSTACLE_PROBABILITY)
+
+    return GameStructure(STARTING_ROAD_WIDTH, ENDING_ROAD_WIDTH, NUM_ADVANCES_LEVEL_COMPLETE, \
         DISPLAY_RATE, RANDOM_OBSTACLE_PROBABILITY, MAX_NUMBER_DISPLAY_ROAD_STATES, \
-        MAX_NUMBER_ROAD_STATES, ADVANCES_LEARNING_INTERVAL, MAX_HISTORY, FAST_MODE)
+        MAX_NUMBER_ROAD_STATES, ADVANCES_LEARNING_INTERVAL, MAX_HISTORY, FAST_MODE, HEADLESS, \
+        road_seed=SEED, road_tapes=road_tapes, profiler=GameProfiler() if PROFILE else None, \
+        telemetry=TelemetryWriter(TELEMETRY_FILE) if (TELEMETRY_FILE is not None) else None, \
+        renderer=TerminalRenderer(RENDERER_FRAMES_PER_SECOND) if (RENDERER_FRAMES_PER_SECOND is not None) else None, \
+        recorder=TrajectoryRecorder(TRAJECTORY_FILE, MAX_NUMBER_DISPLAY_ROAD_STATES) \
+            if (TRAJECTORY_FILE is not None) else None, keep_road_tapes=(ROAD_TAPE_DIRECTORY is not None))
+
+
+# Evaluates the brain's policy on every road width, or, if the policy only fits one road width, on
+# the last road width it was trained on.
+def evaluate_brain(brain):
+    road_widths = brain.get_policy_road_widths()
+    if (road_widths is None):
+        road_widths = range(STARTING_ROAD_WIDTH, ENDING_ROAD_WIDTH)
+    evaluator = PolicyEvaluator(road_widths, EVALUATION_GAMES, EVALUATION_MAX_ADVANCES, RANDOM_OBSTACLE_PROBABILITY, \
+        MAX_NUMBER_DISPLAY_ROAD_STATES, EVALUATION_PROCESSES, first_seed=0 if (SEED is None) else SEED)
+    results = evaluator.evaluate(functools.partial(create_brain_with_settings, BRAIN, current_settings()), brain.get_policy())
+    PolicyEvaluator.print_results(results)
+    return results
+
+
+def road_tape_file(road_width):
+    return os.path.join(ROAD_TAPE_DIRECTORY, 'road_tape_{0}.npy'.format(road_width))
+
+
+def main():
+    random.seed(SEED)
+    numpy.random.seed(SEED)
 
-    deep_q_neural_brain = DeepQNeuralBrain(SAFE_REWARD, CRASH_REWARD, ADVANCES_LEARNING_INTERVAL, DISCOUNT, \
-        GAMMA, NUMBER_ACTIONS, STEP_SIZE, DEEP_Q_TRAINING_INTERVAL, RANDOM_MOVE_PROBABILITY,
-        NUMBER_ROAD_SECTIONS_IN_Q_VALUES)
+    if (NUM_ACTORS > 1):
+        # The actors play their own games, in processes of their own, with none of these.
+        unsupported_settings = [name for name in ('PROFILE', 'TELEMETRY_FILE', 'TRAJECTORY_FILE', \
+            'RENDERER_FRAMES_PER_SECOND', 'ROAD_TAPE_DIRECTORY') if globals()[name]]
+        if (len(unsupported_settings) > 0):
+            raise ValueError('{0} only work with NUM_ACTORS = 1.'.format(', '.join(unsupported_settings)))
+        trainer = ActorLearner(NUM_ACTORS, STARTING_ROAD_WIDTH, ENDING_ROAD_WIDTH, NUM_ADVANCES_LEVEL_COMPLETE, \
+            RANDOM_OBSTACLE_PROBABILITY, MAX_NUMBER_DISPLAY_ROAD_STATES, MAX_NUMBER_ROAD_STATES, \
+            ADVANCES_LEARNING_INTERVAL, MAX_HISTORY, POLICY_BROADCAST_INTERVAL, headless=HEADLESS, seed=SEED)
+        # The actors make their own brains, in their own processes.
+        trainer.start(functools.partial(create_brain_with_settings, BRAIN, current_settings()))
+        if (EVALUATION_GAMES > 0):
+            evaluate_brain(trainer.brain)
+        return trainer.series_results
 
-    game.start(deep_q_neural_brain)
+    game = create_game()
+    # Whatever was written so far is worth keeping, even if the game stops with an exception or
+    # Ctrl+C.
+    try:
+        brain = create_brain(BRAIN)
+        game.start(brain)
+        if (EVALUATION_GAMES > 0):
+            evaluate_brain(brain)
+    finally:
+        if (game.telemetry is not None):
+            game.telemetry.close()
+        if (game.recorder is not None):
+            game.recorder.close()
+    if (ROAD_TAPE_DIRECTORY is not None):
+        os.makedirs(ROAD_TAPE_DIRECTORY, exist_ok=True)
+        for (road_width, road_tape) in game.road_tapes.items():
+            road_tape.save(road_tape_file(road_width))
+    return game.series_results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import numpy
+import slammin_canyon
+from VectorGameStructure import VectorGameStructure
+
+
+"""Measures how fast each brain trains, so that changes can be checked for speed as well as
+correctness. Every brain plays the same headless games, with the same seeds, in a fresh process of
+its own, one brain at a time so that they don't compete for the processor. For each brain it
+reports:
+
+-steps_per_second: advances played per second, learning included.
+-on_before_move and on_after_move: how long the calls take, in microseconds, as the mean and the
+  50th and 99th percentiles over the latest MAX_LATENCY_SAMPLES calls. on_after_move is also broken
+  down into the calls where the brain actually learned.
+-peak_memory_mb: the most memory the brain's process ever used.
+-series: the games, advances and seconds needed to complete each road width.
+-vector: for the brains that pick their moves with a numpy copy of their network, how fast the
+  trained policy plays VECTOR_GAMES games at once in a VectorGameStructure on the last road width,
+  for VECTOR_STEPS steps, with no interpreter round trip per game.
+
+The results are written to RESULTS_FILE as JSON, along with the git revision and the settings, so
+runs from different versions can be compared. A brain that can't run here (tensorflow isn't
+installed, say) gets an error instead of results."""
+
+
+BRAINS = ['QValueBrain', 'CrossEntropyQBrain', 'CrossEntropyNeuralBrain', 'DeepQNeuralBrain', 'NumpyDeepQBrain', \
+    'OptimalPolicyBrain']
+# Any of slammin_canyon's settings. The rest keep the values they have there.
+SETTINGS = {
+    'STARTING_ROAD_WIDTH': 5,
+    'ENDING_ROAD_WIDTH': 9,
+    'NUM_ADVANCES_LEVEL_COMPLETE': 500,
+}
+SEED = 0
+MAX_LATENCY_SAMPLES = 1000000
+VECTOR_GAMES = 256
+VECTOR_STEPS = 2000
+RESULTS_FILE = 'benchmark_results.json'
+
+
+"""Passes every call through to the brain, timing on_before_move and on_after_move along the way."""
+class TimedBrain:
+
+
+    def __init__(self, brain, max_samples):
+        self.brain = brain
+        # A brain without one, such as OptimalPolicyBrain, never learns.
+        self.advances_learning_interval = getattr(brain, 'advances_learning_interval', None)
+        self.max_samples = max_samples
+        self.before_move_nanoseconds = numpy.zeros(max_samples, dtype=numpy.int64)
+        self.after_move_nanoseconds = numpy.zeros(max_samples, dtype=numpy.int64)
+        self.learning_nanoseconds = numpy.zeros(max_samples, dtype=numpy.int64)
+        self.num_before_moves = 0
+        self.num_after_moves = 0
+        self.num_learning_steps = 0
+
+
+    def on_series(self, num_lanes):
+        self.brain.on_series(num_lanes)
+
+
+    def on_before_move(self, car_position, current_road_section, road):
+        start = time.perf_counter_ns()
+        action = self.brain.on_before_move(car_position, current_road_section, road)
+        self.before_move_nanoseconds[self.num_before_moves % self.max_samples] = time.perf_counter_ns() - start
+        self.num_before_moves += 1
+        return action
+
+
+    def on_after_move(self, action, crashed, num_advances, recent_road_states):
+        start = time.perf_counter_ns()
+        self.brain.on_after_move(action, crashed, num_advances, recent_road_states)
+        elapsed = time.perf_counter_ns() - start
+        self.after_move_nanoseconds[self.num_after_moves % self.max_samples] = elapsed
+        self.num_after_moves += 1
+        # The same rule the brains use to decide when to learn.
+        advances_learning_interval = self.advances_learning_interval
+        if (advances_learning_interval is None):
+            return
+        if (crashed or (num_advances % advances_learning_interval == advances_learning_interval-1)):
+            self.learning_nanoseconds[self.num_learning_steps % self.max_samples] = elapsed
+            self.num_learning_steps += 1
+
+
+    def on_crashed(self, fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless=False):
+        self.brain.on_crashed(fast_mode, game_number, display_frequency, road_width, num_advances, max_advances, headless)
+
+
+# Plays the brain's trained policy, always taking the action its network likes best, in num_games
+# games at once.
+def vector_benchmark(brain, road_width, num_games, num_steps, seed):
+    games = VectorGameStructure(num_games, road_width, slammin_canyon.RANDOM_OBSTACLE_PROBABILITY, \
+        slammin_canyon.MAX_NUMBER_DISPLAY_ROAD_STATES, seed)
+    states = numpy.zeros((num_games, brain.state_encoder.state_size), dtype=numpy.float32)
+    crashed_advances = []
+    start_time = time.perf_counter()
+    for step in range(num_steps):
+        games.car_road_states(brain.state_encoder, states)
+        # We subtract 1 because the network works with actions 0-2.
+        (crashed, advances) = games.step(brain.numpy_policy.logits(states).argmax(axis=1) - 1)
+        crashed_advances.append(advances[crashed])
+    seconds = time.perf_counter() - start_time
+    crashed_advances = numpy.concatenate(crashed_advances)
+    return {'num_games': num_games, 'num_steps': num_steps, 'seconds': seconds,
+        'steps_per_second': num_games * num_steps / seconds, 'num_crashes': len(crashed_advances),
+        'mean_advances_at_crash': float(crashed_advances.mean()) if (len(crashed_advances) > 0) else None}
+
+
+def latency_summary(nanoseconds, num_calls):
+    microseconds = nanoseconds[:min(num_calls, len(nanoseconds))] / 1000
+    if (len(microseconds) == 0):
+        return {'calls': 0}
+    return {'calls': num_calls, 'mean_us': float(microseconds.mean()),
+        'p50_us': float(numpy.percentile(microseconds, 50)), 'p99_us': float(numpy.percentile(microseconds, 99))}
+
+
+# Runs in a process of its own, so that the peak memory is the brain's alone.
+def run_benchmark(brain_name, settings, seed, max_latency_samples, vector_games, vector_steps):
+    for (name, value) in settings.items():
+        setattr(slammin_canyon, name, value)
+    slammin_canyon.HEADLESS = True
+    slammin_canyon.SEED = seed
+    random.seed(seed)
+    numpy.random.seed(seed)
+
+    brain = TimedBrain(slammin_canyon.create_brain(brain_name), max_latency_samples)
+    game = slammin_canyon.create_game()
+
+    start_time = time.perf_counter()
+    # The tensorflow brains only import tensorflow once the first series starts.
+    try:
+        game.start(brain)
+    except ImportError as error:
+        return {'error': str(error)}
+    seconds = time.perf_counter() - start_time
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_memory_mb = peak_memory / (1024 * 1024) if (sys.platform == 'darwin') else peak_memory / 1024
+
+    vector_results = None
+    if (hasattr(brain.brain, 'numpy_policy')):
+        vector_results = vector_benchmark(brain.brain, game.road_width, vector_games, vector_steps, seed)
+
+    return {'seconds': seconds, 'num_games': game.num_games_played, 'num_advances': game.num_total_advances,
+        'steps_per_second': game.num_total_advances / seconds,
+        'on_before_move': latency_summary(brain.before_move_nanoseconds, brain.num_before_moves),
+        'on_after_move': latency_summary(brain.after_move_nanoseconds, brain.num_after_moves),
+        'on_after_move_learning': latency_summary(brain.learning_nanoseconds, brain.num_learning_steps),
+        'peak_memory_mb': peak_memory_mb,
+        'series': game.series_results, 'vector': vector_results}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, \
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    results = {'revision': git_revision(), 'python': platform.python_version(), 'numpy': numpy.__version__,
+        'seed': SEED, 'settings': SETTINGS, 'brains': {}}
+
+    # A fresh process for every brain, started from scratch rather than forked.
+    context = multiprocessing.get_context('spawn')
+    for brain_name in BRAINS:
+        with context.Pool(1) as pool:
+            brain_results = pool.apply(run_benchmark, (brain_name, SETTINGS, SEED, MAX_LATENCY_SAMPLES, VECTOR_GAMES, \
+                VECTOR_STEPS))
+        results['brains'][brain_name] = brain_results
+        if ('error' in brain_results):
+            print('{0}: {1}'.format(brain_name, brain_results['error']))
+        else:
+            print('{0}: {1:.0f} steps/s, on_before_move p50 {2:.1f}us p99 {3:.1f}us, {4} games in {5:.1f}s.'.format( \
+                brain_name, brain_results['steps_per_second'], brain_results['on_before_move']['p50_us'], \
+                brain_results['on_before_move']['p99_us'], brain_results['num_games'], brain_results['seconds']))
+            if (brain_results['vector'] is not None):
+                print('{0}: {1:.0f} steps/s playing {2} games at once.'.format(brain_name, \
+                    brain_results['vector']['steps_per_second'], brain_results['vector']['num_games']))
+
+    with open(RESULTS_FILE, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print('Results written to {0}.'.format(RESULTS_FILE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import random
+import numpy
+import slammin_canyon
+from OfflineTrainer import OfflineTrainer
+
+
+"""Pretrains one of the neural brains -- DeepQNeuralBrain, NumpyDeepQBrain or
+CrossEntropyNeuralBrain -- from a recording made by setting slammin_canyon's TRAJECTORY_FILE, as
+fast as it can, and then, if FINE_TUNE is set, carries on training it in live games. The brain is
+made and the live games are played with slammin_canyon's settings, so the rewards and the way the
+brain sees the road are the same as they were for the recording.
+
+For what the brain learned to carry over into the live games, it needs to be width independent:
+leave slammin_canyon's TRANSFER_LEARNING on or set an OBSERVATION_RADIUS."""
+
+
+BRAIN = 'DeepQNeuralBrain'
+TRAJECTORY_FILE = 'trajectories.bin'
+BATCH_SIZE = 1024
+EPOCHS = 4
+PREFETCH_BATCHES = 8
+FINE_TUNE = True
+SEED = None
+
+
+def main():
+    random.seed(SEED)
+    numpy.random.seed(SEED)
+    slammin_canyon.SEED = SEED
+
+    brain = slammin_canyon.create_brain(BRAIN)
+    trainer = OfflineTrainer(TRAJECTORY_FILE, slammin_canyon.SAFE_REWARD, slammin_canyon.CRASH_REWARD, BATCH_SIZE, \
+        EPOCHS, PREFETCH_BATCHES)
+    for result in trainer.start(brain):
+        print('Road width: {0}, transitions: {1}, batches: {2}, seconds: {3:.2f}, loss: {4}.'.format(result['road_width'], \
+            result['num_transitions'], result['num_batches'], result['seconds'], result['loss']))
+
+    if (FINE_TUNE):
+        game = slammin_canyon.create_game()
+        # Whatever was written so far is worth keeping, even if the game stops with an exception
+        # or Ctrl+C.
+        try:
+            game.start(brain)
+        finally:
+            if (game.telemetry is not None):
+                game.telemetry.close()
+            if (game.recorder is not None):
+                game.recorder.close()
+        return game.series_results
+    return trainer.training_results
+
+
+if __name__ == "__main__":
+    main()
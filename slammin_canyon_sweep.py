@@ -0,0 +1,100 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import slammin_canyon
+
+
+"""Runs slammin_canyon headless for many settings at once, one run per process, and collects how
+many games and how many seconds each road width took into a single table.
+
+SEARCH_SPACE maps the names of slammin_canyon's settings to the values to try. A grid search tries
+every combination; a random search tries NUM_RANDOM_CONFIGURATIONS of them, picked at random. Each
+configuration is played SEEDS_PER_CONFIGURATION times, with the seeds FIRST_SEED, FIRST_SEED+1 and
+so on. Any setting not in SEARCH_SPACE keeps the value it has in slammin_canyon."""
+
+
+SEARCH_SPACE = {
+    'BRAIN': ['QValueBrain'],
+    'STEP_SIZE': [0.1, 0.2, 0.4],
+    'DISCOUNT': [0.8, 0.9],
+    'RANDOM_MOVE_PROBABILITY': [0.001, 0.01],
+}
+# Either 'grid' or 'random'.
+SEARCH = 'grid'
+NUM_RANDOM_CONFIGURATIONS = 10
+SEEDS_PER_CONFIGURATION = 1
+FIRST_SEED = 0
+# None uses every core on the box.
+NUM_PROCESSES = None
+RESULTS_FILE = 'sweep_results.csv'
+
+
+def create_configurations(search_space, search, num_random_configurations, search_seed=None):
+    for name in search_space:
+        if ((not name.isupper()) or (not hasattr(slammin_canyon, name))):
+            raise ValueError('slammin_canyon has no setting called {0}.'.format(name))
+
+    names = list(search_space)
+    configurations = [dict(zip(names, values)) for values in itertools.product(*search_space.values())]
+    if (search == 'random'):
+        configurations = random.Random(search_seed).sample(configurations, min(num_random_configurations, len(configurations)))
+    elif (search != 'grid'):
+        raise ValueError('Unknown search: {0}'.format(search))
+    return configurations
+
+
+# Plays one configuration with one seed. Runs in a process of its own, which is thrown away
+# afterwards, so the settings it changes never leak into the next configuration.
+def run_configuration(configuration_number, configuration, seed):
+    for (name, value) in configuration.items():
+        setattr(slammin_canyon, name, value)
+    slammin_canyon.HEADLESS = True
+    slammin_canyon.NUM_ACTORS = 1
+    slammin_canyon.SEED = seed
+
+    series_results = slammin_canyon.main()
+    results = []
+    for series_result in series_results:
+        result = {'configuration': configuration_number, 'seed': seed}
+        result.update(configuration)
+        result.update(series_result)
+        results.append(result)
+    return results
+
+
+def run_sweep(configurations, seeds_per_configuration=1, first_seed=0, num_processes=None):
+    runs = [(configuration_number, configuration, first_seed + seed_number)
+        for (configuration_number, configuration) in enumerate(configurations)
+        for seed_number in range(seeds_per_configuration)]
+    # Start the processes from scratch, rather than forking, so that nothing this process has set up
+    # (tensorflow in particular) finds its way into them.
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(num_processes, maxtasksperchild=1) as pool:
+        results = pool.starmap(run_configuration, runs, chunksize=1)
+    return [result for run_results in results for result in run_results]
+
+
+def main():
+    configurations = create_configurations(SEARCH_SPACE, SEARCH, NUM_RANDOM_CONFIGURATIONS, FIRST_SEED)
+    num_processes = NUM_PROCESSES if (NUM_PROCESSES is not None) else os.cpu_count()
+    print('Running {0} configurations, {1} seeds each, on {2} processes.'.format(len(configurations), \
+        SEEDS_PER_CONFIGURATION, num_processes))
+    results = run_sweep(configurations, SEEDS_PER_CONFIGURATION, FIRST_SEED, num_processes)
+
+    columns = ['configuration', 'seed'] + list(SEARCH_SPACE) + ['road_width', 'num_games', 'num_advances', 'seconds']
+    with open(RESULTS_FILE, 'w', newline='') as results_file:
+        writer = csv.DictWriter(results_file, columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print(' '.join('{0:>12}'.format(column[:12]) for column in columns))
+    for result in results:
+        print(' '.join('{0:>12}'.format(round(result[column], 3) if isinstance(result[column], float) \
+            else str(result[column])[:12]) for column in columns))
+    print('Results written to {0}.'.format(RESULTS_FILE))
+
+
+if __name__ == "__main__":
+    main()